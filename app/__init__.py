@@ -22,6 +22,8 @@ def create_app(config_class=Config):
     with app.app_context():
         from .search_preprocessing import ensure_preprocessed_data
         ensure_preprocessed_data()
+        from .leaderboard import ensure_leaderboard
+        ensure_leaderboard()
         from .routes import main_bp
         app.register_blueprint(main_bp)
 
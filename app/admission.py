@@ -0,0 +1,132 @@
+"""
+Admission control for the search API.
+
+Every search method has its own limiter: at most `concurrency` requests
+run at once, at most `queue_size` more wait for a slot, and none waits
+longer than ADMISSION_QUEUE_TIMEOUT_MS. Anything beyond that is rejected
+immediately, 429 when the queue is full and 503 when the wait timed out,
+so latency stays bounded under a traffic spike instead of growing with
+the backlog. Limits are per worker process.
+
+Each limiter also keeps a moving average of how long its requests run,
+which lets a request with a deadline skip a method it cannot finish in
+time.
+"""
+import os
+import asyncio
+from typing import Dict, Optional
+
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 1000))
+# Weight of the newest request in the moving average of service times
+EWMA_ALPHA = 0.2
+
+# method -> (concurrent requests, waiting requests); embedding search is bound by the encoder
+DEFAULT_LIMITS = {
+    'bm25': (8, 32),
+    'embedding': (2, 8),
+    'simple': (4, 16),
+}
+
+
+class Overloaded(Exception):
+    """A request was not admitted; status_code is 429 (queue full) or 503 (wait timed out)."""
+
+    def __init__(self, method: str, status_code: int, reason: str):
+        super().__init__(f"{method}: {reason}")
+        self.method = method
+        self.status_code = status_code
+        self.reason = reason
+
+
+class Limiter:
+    """Concurrency limit with a bounded, time-limited queue for one search method."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int,
+                 queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout_ms = queue_timeout_ms
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.ewma_ms: Optional[float] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @property
+    def headroom(self) -> int:
+        """Requests that can still be started or queued right now."""
+        return self.concurrency + self.queue_size - self.in_flight - self.waiting
+
+    async def acquire(self, timeout_ms: Optional[float] = None):
+        """
+        Waits for a slot.
+
+        Args:
+            timeout_ms: Longest wait, capped at the limiter's queue timeout
+
+        Raises:
+            Overloaded: The queue is full or no slot freed up in time
+        """
+        if self.in_flight < self.concurrency and not self.waiting:
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.queue_size:
+                self.rejected_full += 1
+                raise Overloaded(self.name, 429, "too many queued requests")
+            timeout_ms = self.queue_timeout_ms if timeout_ms is None else min(timeout_ms, self.queue_timeout_ms)
+            self.waiting += 1
+            try:
+                # Unlike wait_for(), timeout() cancels the acquire in this task, and a
+                # cancelled Semaphore.acquire() hands back a permit it was just granted
+                async with asyncio.timeout(max(timeout_ms, 0) / 1000):
+                    await self._semaphore.acquire()
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise Overloaded(self.name, 503, f"no free slot within {timeout_ms:.0f} ms")
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self, elapsed_ms: float):
+        """Frees the slot and folds the request's run time into the moving average."""
+        self.in_flight -= 1
+        self._semaphore.release()
+        if self.ewma_ms is None:
+            self.ewma_ms = elapsed_ms
+        else:
+            self.ewma_ms += EWMA_ALPHA * (elapsed_ms - self.ewma_ms)
+
+    def stats(self) -> Dict:
+        return {
+            'concurrency': self.concurrency,
+            'queue_size': self.queue_size,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'headroom': self.headroom,
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_full,
+            'rejected_timeout': self.rejected_timeout,
+            'ewma_ms': self.ewma_ms,
+        }
+
+
+def _limit(method: str, setting: str, default: int) -> int:
+    return int(os.environ.get(f'ADMISSION_{method.upper()}_{setting}', default))
+
+
+_limiters = {
+    method: Limiter(method, _limit(method, 'CONCURRENCY', concurrency), _limit(method, 'QUEUE', queue_size))
+    for method, (concurrency, queue_size) in DEFAULT_LIMITS.items()
+}
+
+
+def get_limiter(method: str) -> Limiter:
+    return _limiters[method]
+
+
+def admission_stats() -> Dict[str, Dict]:
+    return {method: limiter.stats() for method, limiter in _limiters.items()}
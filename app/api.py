@@ -1,19 +1,41 @@
 import logging
-from fastapi import FastAPI, Query, HTTPException, Depends
+import os
+import tempfile
+from fastapi import FastAPI, Query, HTTPException, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from app import create_app
 from contextlib import contextmanager
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from .schemas import SearchMethod, CorpusInfo, SearchResponse, SearchResult
+from .schemas import SearchMethod, EmbeddingScoring, CorpusInfo, SearchResponse, SearchResult, SuggestResponse, RerankInfo
 from .models import Recipe as DBRecipe
 from .search_preprocessing import load_whoosh_index, load_embeddings
-from sentence_transformers import SentenceTransformer, util
+from .neighbours import get_similar_recipes
+from .multivector import EMBEDDING_SCORING, load_multivector, search_multivector
+from sentence_transformers import util
 import torch
 from whoosh.qparser import MultifieldParser
 import time
 import nltk
 from typing import Optional, List, Dict
-from .database import get_db
+from .database import get_db, engine
+from .queries import fetch_recipes_by_ids
+from .pool import pool_status
+from .metrics import SearchSpans, render_metrics
+from .encoder import ENCODER_PRELOAD, encode_query, encoder_loaded, get_encoder
+from .query_cache import log_query, lookup_query_embedding
+from .suggest import suggest, load_suggest_index
+from .spelling import correct_query, load_spelling_index
+from .rerank import RERANK_BUDGET_MS, RERANK_CANDIDATES, RERANK_PRELOAD, get_reranker, reranker_loaded, rerank as rerank_recipes
+from .shards import ShardError, get_coordinator
+from .ingest import ingest_csv, is_ingest_authorized
+from .snapshots import SnapshotError, refresh_snapshot, verify_snapshot
+from .admission import Overloaded, admission_stats, get_limiter
+from .serialization import iter_result_list, iter_results, iter_search_response
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware, allocation_window, is_authorized, profile_thread
+from .extensions import db as flask_db
 import uvicorn
 
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +43,11 @@ logger = logging.getLogger(__name__)
 
 flask_app = create_app()
 
+# Deepest rank a page of /search may reach (offset + limit)
+SEARCH_MAX_DEPTH = int(os.environ.get('SEARCH_MAX_DEPTH', 500))
+# Responses with more results than this are streamed in chunks instead of sent in one piece
+STREAM_MIN_RESULTS = int(os.environ.get('STREAM_MIN_RESULTS', 50))
+
 app = FastAPI(
     title="Recipe Search API",
     description="API for searching recipes using various methods",
@@ -38,6 +65,8 @@ class FlaskContextMiddleware(BaseHTTPMiddleware):
         self.flask_app = flask_app
 
     async def dispatch(self, request, call_next):
+        # Switch to a newly published snapshot before the request touches any artifact
+        refresh_snapshot()
         # Create Flask context for the duration of the request
         with self.flask_app.app_context():
             response = await call_next(request)
@@ -45,6 +74,28 @@ class FlaskContextMiddleware(BaseHTTPMiddleware):
         
 
 app.add_middleware(FlaskContextMiddleware, flask_app=flask_app)
+# Added last so it wraps everything else; not installed at all unless PROFILING_ENABLED=1
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+def require_profiling_token(x_profile_token: Optional[str] = Header(default=None)):
+    """Hides the profiling endpoints unless profiling is enabled and the token matches."""
+    if not is_authorized(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+def require_ingest_token(x_admin_token: Optional[str] = Header(default=None)):
+    """Hides the ingest endpoint unless INGEST_TOKEN is set and matches."""
+    if not is_ingest_authorized(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+def json_response(chunks, streamed: bool) -> Response:
+    """Sends JSON chunks either as one body or as a chunked stream."""
+    if streamed:
+        return StreamingResponse(chunks, media_type="application/json")
+    return Response(b''.join(chunks), media_type="application/json")
 
 
 @app.on_event("startup")
@@ -52,6 +103,21 @@ async def startup_event():
     """Log when the API starts up"""
     logger.info("API is starting up...")
     logger.info("Initializing search components...")
+    # Load the encoder before the first request instead of during it
+    if ENCODER_PRELOAD:
+        get_encoder()
+    if RERANK_PRELOAD:
+        get_reranker()
+    load_suggest_index()
+    load_spelling_index()
+    load_multivector()
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        logger.info(f"Sharded search enabled: {coordinator.ping()}")
+        try:
+            coordinator.check_generation()
+        except ShardError:
+            pass  # Already logged; searches fail until the shards are rebuilt
 
 
 @app.get("/")
@@ -61,6 +127,117 @@ async def root():
     return {"API is running"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 only if this worker can serve searches right now.
+
+    Requires a valid snapshot with its artifacts loaded, the encoder loaded
+    (when ENCODER_PRELOAD is on), the cross-encoder loaded (when
+    RERANK_PRELOAD is on), shards built from the same snapshot (when
+    SHARD_ADDRESSES is set), a free database connection or overflow slot,
+    and room in at least one search lane. Returns 503 with the same report
+    otherwise.
+    """
+    checks = {}
+    try:
+        checks['snapshot'] = verify_snapshot(full=False)['generation']
+        load_whoosh_index()
+        load_spelling_index()
+        load_suggest_index()
+        load_multivector()
+        checks['artifacts'] = True
+    except Exception as e:
+        checks['artifacts'] = False
+        checks['error'] = str(e)
+    checks['encoder'] = encoder_loaded()
+    checks['reranker'] = reranker_loaded()
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        try:
+            await run_in_threadpool(coordinator.check_generation)
+            checks['shards'] = True
+        except ShardError as e:
+            checks['shards'] = False
+            checks['shards_error'] = str(e)
+    pool = pool_status(engine)
+    checks['db_pool'] = pool
+    # max_overflow of -1 means no limit
+    pool_full = 'size' in pool and 0 <= pool['max_overflow'] and pool['checked_out'] >= pool['size'] + pool['max_overflow']
+    admission = admission_stats()
+    checks['admission'] = admission
+
+    is_ready = (
+        checks['artifacts']
+        and (checks['encoder'] or not ENCODER_PRELOAD)
+        and (checks['reranker'] or not RERANK_PRELOAD)
+        and checks.get('shards', True)
+        and not pool_full
+        and any(lane['headroom'] > 0 for lane in admission.values())
+    )
+    return JSONResponse({'ready': is_ready, **checks}, status_code=200 if is_ready else 503)
+
+
+@app.get("/snapshot")
+async def get_snapshot():
+    """Manifest of the snapshot this worker serves from."""
+    try:
+        return verify_snapshot(full=False)
+    except SnapshotError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/pool-stats")
+async def get_pool_stats():
+    """Connection pool usage of the API session engine and the Flask-SQLAlchemy engine."""
+    with flask_app.app_context():
+        flask_engine = flask_db.engine
+    return {
+        "api": pool_status(engine),
+        "flask": pool_status(flask_engine),
+    }
+
+
+@app.post("/admin/profile/window", dependencies=[Depends(require_profiling_token)])
+async def open_profile_window(requests: int = Query(default=100, ge=1, le=10000)):
+    """Start tracking allocations (tracemalloc) and torch/OS thread usage for the next N requests."""
+    allocation_window.open(requests)
+    return allocation_window.report()
+
+
+@app.get("/admin/profile/window", dependencies=[Depends(require_profiling_token)])
+async def get_profile_window():
+    """Per-request allocation and thread statistics of the current or last window."""
+    return allocation_window.report()
+
+
+@app.post("/admin/ingest", dependencies=[Depends(require_ingest_token)])
+async def ingest_recipes(request: Request, refresh: bool = True, chunk_size: int = Query(default=1000, ge=1, le=10000)):
+    """
+    Bulk-upsert recipes from a CSV sent as the raw request body (Content-Type: text/csv).
+
+    The body is streamed to a temporary file, then ingested in chunks; the search
+    index, embeddings and neighbours are refreshed for the affected ids only.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+        path = f.name
+
+    def run():
+        with flask_app.app_context():
+            return ingest_csv(path, chunk_size, refresh=refresh)
+
+    try:
+        report = await run_in_threadpool(profile_thread(run))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(path)
+    logger.info(f"Ingested {report['rows']} rows at {report['rows_per_sec']:.0f} rows/sec")
+    return report
+
+
 @app.get("/methods", response_model=List[SearchMethod])
 async def get_search_methods():
     """Get list of available search methods."""
@@ -101,12 +278,221 @@ async def get_corpus_info(db: Session = Depends(get_db)):
     )
 
 
+@app.get("/recipes/{recipe_id}/similar", response_model=List[SearchResult])
+async def get_similar(
+    recipe_id: int,
+    limit: int = Query(default=10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Get recipes most similar to the given one.
+
+    Neighbours are precomputed offline, so this is a table lookup
+    followed by a single bulk fetch from the database.
+    """
+    if db.query(DBRecipe.id).filter(DBRecipe.id == recipe_id).first() is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    neighbours = get_similar_recipes(recipe_id, limit)
+    id_to_score = dict(neighbours)
+    recipes = fetch_recipes_by_ids(db, [rid for rid, _ in neighbours])
+    return json_response(iter_result_list(recipes, id_to_score), len(recipes) > STREAM_MIN_RESULTS)
+
+
+@app.get("/suggest", response_model=SuggestResponse)
+async def get_suggestions(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=20)
+):
+    """Typeahead completions for recipe names and ingredients, most popular first."""
+    return SuggestResponse(prefix=prefix, suggestions=suggest(prefix, limit))
+
+
+def execute_search(db: Session, spans: SearchSpans, method: SearchMethod, query: str, limit: int,
+                   offset: int, scoring: EmbeddingScoring, include_scores: bool, rerank: bool,
+                   deadline: Optional[float] = None, query_embedding: Optional[torch.Tensor] = None) -> Dict:
+    """
+    Runs one search; blocking, so it is called from the threadpool.
+
+    Args:
+        deadline: time.perf_counter() value the rerank stage must finish by
+        query_embedding: Precomputed query vector, skips the encoder (embedding only)
+
+    Returns:
+        Dict with the page of recipes, id_to_score, has_more, corrected_query and rerank_info
+    """
+    recipes = []
+    id_to_score = {}
+    corrected_query = None
+    rerank_info = None
+    has_more = False
+    end = offset + limit
+    # One hit past the page tells whether there is a next one;
+    # the reranker needs a deeper candidate list than the page it returns
+    depth = max(end + 1, RERANK_CANDIDATES) if rerank else end + 1
+
+    # Set when the corpus is served by shard workers (SHARD_ADDRESSES)
+    coordinator = get_coordinator()
+
+    if method == SearchMethod.BM25:
+        # Rewrite misspelled words before parsing
+        with spans.stage('spell'):
+            corrected_query = correct_query(query)
+        if coordinator is not None:
+            # Every shard scores with the corpus-wide BM25 statistics, then the top-k are merged
+            with spans.stage('score'):
+                hits = coordinator.search_bm25(corrected_query or query, depth)
+            recipe_ids = [recipe_id for recipe_id, _ in hits]
+            scores = [score for _, score in hits] if include_scores else None
+        else:
+            # Load and use Whoosh index for searching
+            with spans.stage('load'):
+                whoosh_index = load_whoosh_index()
+            with whoosh_index.searcher() as searcher:
+                # Parse and execute the query
+                with spans.stage('parse'):
+                    parser = MultifieldParser(["name", "ingredients", "text"], 
+                                           schema=whoosh_index.schema)
+                    parsed_query = parser.parse(corrected_query or query)
+                with spans.stage('score'):
+                    search_results = searcher.search(parsed_query, limit=depth)
+                
+                    # Extract IDs and scores from search results
+                    recipe_ids = [int(hit['id']) for hit in search_results]
+                    scores = [hit.score for hit in search_results] if include_scores else None
+                    
+    elif method == SearchMethod.EMBEDDING:
+        # Generate embedding for the search query
+        if query_embedding is None:
+            with spans.stage('encode'):
+                query_embedding = encode_query(query)
+
+        if coordinator is not None:
+            # Each shard scores its segment of the embedding matrix; shards hold single vectors only
+            with spans.stage('score'):
+                hits = coordinator.search_embedding(query_embedding.cpu().numpy(), depth)
+            recipe_ids = [recipe_id for recipe_id, _ in hits]
+            scores = [score for _, score in hits] if include_scores else None
+        elif scoring != EmbeddingScoring.SINGLE:
+            # One product over all vectors, then a max per recipe (and field)
+            with spans.stage('score'):
+                hits = search_multivector(query_embedding.cpu().numpy()[0], depth, scoring.value)
+            recipe_ids = [recipe_id for recipe_id, _ in hits]
+            scores = [score for _, score in hits] if include_scores else None
+        else:
+            # Load pre-computed embeddings
+            with spans.stage('load'):
+                recipe_ids, stored_embeddings = load_embeddings()
+
+            # Calculate similarities and get top results
+            with spans.stage('score'), torch.inference_mode():
+                similarities = util.pytorch_cos_sim(query_embedding, stored_embeddings)[0]
+            with spans.stage('topk'):
+                top_k = torch.topk(similarities, min(depth, len(similarities)))
+                top_indices = top_k.indices.tolist()
+                scores = top_k.values.tolist() if include_scores else None
+            
+                # Get recipe IDs for top results
+                recipe_ids = [recipe_ids[idx] for idx in top_indices]
+
+    if method in (SearchMethod.BM25, SearchMethod.EMBEDDING):
+        has_more = len(recipe_ids) > end
+        id_to_score = dict(zip(recipe_ids, scores)) if scores else {}
+        if rerank:
+            # Fetch all candidates, keeping search order, and page after rescoring
+            with spans.stage('hydrate'):
+                recipes = fetch_recipes_by_ids(db, recipe_ids)
+            budget_ms = RERANK_BUDGET_MS
+            if deadline is not None:
+                budget_ms = min(budget_ms, (deadline - time.perf_counter()) * 1000)
+            with spans.stage('rerank'):
+                recipes, rerank_scores, rerank_info = rerank_recipes(corrected_query or query, recipes, budget_ms)
+            if rerank_scores is not None and include_scores:
+                id_to_score = dict(zip((r.id for r in recipes), rerank_scores))
+            recipes = recipes[offset:end]
+        else:
+            # Only the requested page is fetched, keeping search order
+            with spans.stage('hydrate'):
+                recipes = fetch_recipes_by_ids(db, recipe_ids[offset:end])
+                
+    elif method == SearchMethod.SIMPLE:
+        # Perform simple text search using SQL LIKE
+        with spans.stage('hydrate'):
+            recipes = db.query(DBRecipe).filter(
+                or_(
+                    DBRecipe.name.like(f"%{query}%"),
+                    DBRecipe.type.like(f"%{query}%"),
+                    DBRecipe.kitchen.like(f"%{query}%"),
+                    DBRecipe.text.like(f"%{query}%")
+                )
+            ).order_by(DBRecipe.id).offset(offset).limit(limit + 1).all()
+        has_more = len(recipes) > limit
+        recipes = recipes[:limit]
+
+    return {
+        'recipes': recipes,
+        'id_to_score': id_to_score,
+        'has_more': has_more,
+        'corrected_query': corrected_query,
+        'rerank_info': rerank_info,
+    }
+
+
+async def admit(method: SearchMethod, query: str, spans: SearchSpans, deadline: Optional[float]):
+    """
+    Takes a slot for a search, degrading an embedding search that cannot meet its deadline.
+
+    Without a deadline, or for other methods, the request waits in its
+    method's queue or is rejected. With a deadline, an embedding search only
+    waits while its expected run time still fits; otherwise it is served
+    from the precomputed query embedding table if the query is there, or by
+    BM25, both in the cheap BM25 lane.
+
+    Returns:
+        (limiter holding the slot, method to run, fallback name or None, precomputed query embedding or None)
+
+    Raises:
+        Overloaded: No slot in the lane the request ended up in
+    """
+    limiter = get_limiter(method.value)
+    if method != SearchMethod.EMBEDDING or deadline is None:
+        with spans.stage('queue'):
+            await limiter.acquire(None if deadline is None else (deadline - time.perf_counter()) * 1000)
+        return limiter, method, None, None
+
+    # Wait only as long as the usual run time still fits into what is left
+    budget_ms = (deadline - time.perf_counter()) * 1000 - (limiter.ewma_ms or 0)
+    try:
+        if budget_ms <= 0:
+            raise Overloaded(method.value, 503, "expected run time exceeds the deadline")
+        with spans.stage('queue'):
+            await limiter.acquire(budget_ms)
+        return limiter, method, None, None
+    except Overloaded:
+        pass
+
+    cached = lookup_query_embedding(query)
+    if cached is not None:
+        served, fallback, query_embedding = method, 'cached_embedding', torch.from_numpy(cached).unsqueeze(0)
+    else:
+        served, fallback, query_embedding = SearchMethod.BM25, 'bm25', None
+    limiter = get_limiter(SearchMethod.BM25.value)
+    with spans.stage('queue'):
+        await limiter.acquire((deadline - time.perf_counter()) * 1000)
+    return limiter, served, fallback, query_embedding
+
+
 @app.get("/search", response_model=SearchResponse)
 async def search_recipes(
     query: str,
     method: SearchMethod = SearchMethod.BM25,
     limit: int = Query(default=10, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    scoring: EmbeddingScoring = EmbeddingScoring(EMBEDDING_SCORING),
     include_scores: bool = False,
+    rerank: bool = False,
+    deadline_ms: Optional[float] = Query(default=None, gt=0, le=60000),
+    debug: bool = False,
     db: Session = Depends(get_db)
 ):
     """
@@ -116,94 +502,78 @@ async def search_recipes(
         query: Search query
         method: Search method to use
         limit: Maximum number of results
+        offset: Number of top-ranked results to skip, for pagination
+        scoring: For method=embedding, score by the single recipe vector or by the
+            max / field-weighted max over the per-field and text-chunk vectors
         include_scores: Whether to include relevance scores
+        rerank: Rescore the top candidates with the cross-encoder (bm25 and embedding only)
+        deadline_ms: Time budget; an embedding search that cannot make it falls back
+            to a precomputed query embedding or to BM25 instead of queueing
+        debug: Whether to include per-stage timings in the response
         db: Database session (injected by FastAPI)
         
     Returns:
-        SearchResponse object containing search results
+        SearchResponse object containing search results; next_offset is set
+        when more results follow
+
+    Raises:
+        HTTPException: 429 when the method's queue is full, 503 when no slot freed up in time
     """
-    start_time = time.time()
-    results = []
-    
+    if offset + limit > SEARCH_MAX_DEPTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset + limit must not exceed {SEARCH_MAX_DEPTH}"
+        )
+
+    start_time = time.perf_counter()
+    deadline = start_time + deadline_ms / 1000 if deadline_ms is not None else None
+    spans = SearchSpans('api', method.value, debug=debug)
+    log_query(query, method.value)
+
     try:
-        if method == SearchMethod.BM25:
-            # Load and use Whoosh index for searching
-            whoosh_index = load_whoosh_index()
-            with whoosh_index.searcher() as searcher:
-                # Parse and execute the query
-                parser = MultifieldParser(["name", "ingredients", "text"], 
-                                       schema=whoosh_index.schema)
-                parsed_query = parser.parse(query)
-                search_results = searcher.search(parsed_query, limit=limit)
-                
-                # Extract IDs and scores from search results
-                recipe_ids = [int(hit['id']) for hit in search_results]
-                scores = [hit.score for hit in search_results] if include_scores else None
-                
-                # Fetch matching recipes from database
-                recipes = db.query(DBRecipe).filter(DBRecipe.id.in_(recipe_ids)).all()
-                id_to_recipe = {r.id: r for r in recipes}
-                
-                # Create search results maintaining original search order
-                for i, rid in enumerate(recipe_ids):
-                    if rid in id_to_recipe:
-                        results.append(SearchResult(
-                            recipe=id_to_recipe[rid],
-                            score=scores[i] if scores else None
-                        ))
-                        
-        elif method == SearchMethod.EMBEDDING:
-            # Load pre-computed embeddings and initialize model
-            recipe_ids, stored_embeddings = load_embeddings()
-            model = SentenceTransformer('all-MiniLM-L6-v2')
-            
-            # Generate embedding for the search query
-            query_embedding = model.encode(query, convert_to_tensor=True)
-            query_embedding = util.normalize_embeddings(query_embedding.unsqueeze(0))
-            
-            # Calculate similarities and get top results
-            similarities = util.pytorch_cos_sim(query_embedding, stored_embeddings)[0]
-            top_k = torch.topk(similarities, min(limit, len(similarities)))
-            top_indices = top_k.indices.tolist()
-            scores = top_k.values.tolist() if include_scores else None
-            
-            # Get recipe IDs for top results
-            recipe_ids = [recipe_ids[idx] for idx in top_indices]
-            
-            # Fetch matching recipes from database
-            recipes = db.query(DBRecipe).filter(DBRecipe.id.in_(recipe_ids)).all()
-            id_to_recipe = {r.id: r for r in recipes}
-            
-            # Create search results maintaining original order
-            for i, rid in enumerate(recipe_ids):
-                if rid in id_to_recipe:
-                    results.append(SearchResult(
-                        recipe=id_to_recipe[rid],
-                        score=scores[i] if scores else None
-                    ))
-                    
-        elif method == SearchMethod.SIMPLE:
-            # Perform simple text search using SQL LIKE
-            recipes = db.query(DBRecipe).filter(
-                db.or_(
-                    DBRecipe.name.like(f"%{query}%"),
-                    DBRecipe.type.like(f"%{query}%"),
-                    DBRecipe.kitchen.like(f"%{query}%"),
-                    DBRecipe.text.like(f"%{query}%")
-                )
-            ).limit(limit).all()
+        limiter, served, fallback, query_embedding = await admit(method, query, spans, deadline)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Search overloaded ({e})",
+            headers={"Retry-After": "1"}
+        )
+    # Stage histograms describe the work that actually ran
+    spans.method = served.value
 
-        results = [SearchResult(recipe=recipe) for recipe in recipes]
-            
-        execution_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-        
-        return SearchResponse(
-            query=query,
-            method=method,
-            execution_time_ms=execution_time,
-            total_results=len(results),
-            results=results
+    run_start = time.perf_counter()
+    try:
+        # Blocking work runs in the threadpool so queued requests are not stuck behind it
+        result = await run_in_threadpool(
+            profile_thread(execute_search), db, spans, served, query, limit, offset, scoring,
+            include_scores, rerank, deadline, query_embedding
         )
+        recipes, id_to_score = result['recipes'], result['id_to_score']
+
+        # Results are encoded from cached per-recipe JSON fragments;
+        # large pages are encoded chunk by chunk while they are sent
+        streamed = len(recipes) > STREAM_MIN_RESULTS
+        results = iter_results(recipes, id_to_score)
+        if not streamed:
+            with spans.stage('serialize'):
+                results = list(results)
+
+        execution_time = (time.perf_counter() - start_time) * 1000  # Convert to milliseconds
+        timings = spans.finish()
+
+        meta = {
+            'query': query,
+            'method': method.value,
+            'execution_time_ms': execution_time,
+            'total_results': len(recipes),
+            'offset': offset,
+            'next_offset': offset + limit if result['has_more'] else None,
+            'fallback': fallback,
+            'corrected_query': result['corrected_query'],
+            'rerank': RerankInfo(**result['rerank_info']).model_dump() if result['rerank_info'] else None,
+            'timings': timings if debug else None,
+        }
+        return json_response(iter_search_response(meta, results), streamed)
         
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
@@ -211,6 +581,14 @@ async def search_recipes(
             status_code=500,
             detail=f"Search failed: {str(e)}"
         )
+    finally:
+        limiter.release((time.perf_counter() - run_start) * 1000)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Search latency histograms in the Prometheus text format."""
+    return render_metrics()
     
 
 if __name__ == "__main__":
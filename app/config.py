@@ -1,8 +1,40 @@
 import os
 
+# Shared by Flask-SQLAlchemy and the API's SessionLocal so both services connect the same way
+DATABASE_URL = os.environ.get('DATABASE_URL', 'mysql+pymysql://app_user:app_password@db/recipes_db')
+
+
+def engine_options(database_url: str = DATABASE_URL) -> dict:
+    """
+    Builds SQLAlchemy engine options from environment variables.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING and DB_QUERY_CACHE_SIZE override the defaults below.
+    In-memory SQLite (used by benchmarks) keeps SQLAlchemy's own pool.
+    """
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'query_cache_size': int(os.environ.get('DB_QUERY_CACHE_SIZE', 500)),
+    }
+    if database_url == 'sqlite://' or ':memory:' in database_url:
+        return options
+
+    from .pool import InstrumentedQueuePool
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # MySQL drops idle connections after wait_timeout (8h by default)
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    })
+    return options
+
+
 class Config:
     """Flask application configuration class."""
     
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_secret_key'
-    SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://app_user:app_password@db/recipes_db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URL)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -1,11 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker, scoped_session
-import os
 import time
 import logging
 
+from .config import DATABASE_URL
+from .pool import create_db_engine
+
 logger = logging.getLogger(__name__)
 
+
 def wait_for_db(database_url: str, max_retries: int = 30, retry_interval: int = 1):
     """
     Wait for database to become available.
@@ -15,10 +18,12 @@ def wait_for_db(database_url: str, max_retries: int = 30, retry_interval: int =
         max_retries: Maximum number of connection attempts
         retry_interval: Time between attempts in seconds
     """
-    engine = create_engine(database_url)
+    engine = create_db_engine(database_url)
     for attempt in range(max_retries):
         try:
-            engine.connect()
+            # Return the probe connection to the pool instead of leaking it
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
             logger.info("Successfully connected to the database")
             return engine
         except Exception as e:
@@ -28,9 +33,6 @@ def wait_for_db(database_url: str, max_retries: int = 30, retry_interval: int =
             logger.warning(f"Database connection attempt {attempt + 1} failed. Retrying in {retry_interval} seconds...")
             time.sleep(retry_interval)
 
-# Get database URL from environment variable
-DATABASE_URL = os.getenv('DATABASE_URL', 'mysql+pymysql://app_user:app_password@db/recipes_db')
-
 # Create engine with retry logic
 engine = wait_for_db(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -42,4 +44,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,115 @@
+import os
+import logging
+import threading
+from typing import List, Union
+
+import torch
+from sentence_transformers import SentenceTransformer, util
+
+from .query_cache import lookup_query_embedding
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# torch (default), quantized (dynamic int8 Linear layers) or onnx (ONNX Runtime, needs optimum[onnxruntime])
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'torch')
+# Load the model at startup; with 0 it is loaded on the first query missing from the precomputed table
+ENCODER_PRELOAD = os.environ.get('ENCODER_PRELOAD', '1') == '1'
+# Split the cores between workers instead of letting each one grab all of them
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+ENCODER_THREADS = int(os.environ.get('ENCODER_THREADS', max(1, (os.cpu_count() or 1) // WORKERS)))
+
+_encoders = {}
+_lock = threading.Lock()
+_threads_configured = False
+
+
+def configure_torch_threads(threads: int = ENCODER_THREADS):
+    """
+    Limits torch to `threads` intra-op threads and a single inter-op thread.
+
+    Inter-op threads can only be set before torch runs any parallel work,
+    so this is done once, before the first model is loaded.
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        logger.warning("torch inter-op threads already initialized, leaving them unchanged")
+    _threads_configured = True
+    logger.info(f"torch configured with {threads} intra-op thread(s)")
+
+
+class QueryEncoder:
+    """
+    Sentence-transformer encoder tuned for CPU inference.
+
+    Encoding runs under torch.inference_mode(), and the model is loaded once
+    per process and backend.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, backend: str = ENCODER_BACKEND):
+        configure_torch_threads()
+        self.model_name = model_name
+        self.backend = backend
+
+        if backend == 'onnx':
+            try:
+                self.model = SentenceTransformer(model_name, backend='onnx')
+            except Exception as e:
+                logger.warning(f"ONNX backend unavailable ({e}), falling back to torch")
+                self.backend = 'torch'
+                self.model = SentenceTransformer(model_name, device='cpu')
+        else:
+            self.model = SentenceTransformer(model_name, device='cpu')
+            if backend == 'quantized':
+                self.model = torch.ao.quantization.quantize_dynamic(
+                    self.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+        self.model.eval()
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> torch.Tensor:
+        """
+        Encodes one or more texts into L2-normalized embeddings.
+
+        Returns:
+            Tensor of shape (n, dim); a single string gives n = 1
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        with torch.inference_mode():
+            embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_tensor=True)
+        return util.normalize_embeddings(embeddings)
+
+
+def get_encoder(backend: str = ENCODER_BACKEND) -> QueryEncoder:
+    """Returns the process-wide encoder for a backend, loading it on first use."""
+    encoder = _encoders.get(backend)
+    if encoder is None:
+        with _lock:
+            encoder = _encoders.get(backend)
+            if encoder is None:
+                encoder = _encoders[backend] = QueryEncoder(backend=backend)
+    return encoder
+
+
+def encoder_loaded(backend: str = ENCODER_BACKEND) -> bool:
+    """Whether the model for a backend is already loaded in this process."""
+    return backend in _encoders
+
+
+def encode_query(query: str) -> torch.Tensor:
+    """
+    Encodes a search query into a (1 x dim) normalized embedding.
+
+    Frequent queries and recipe names come from the precomputed table;
+    only misses run the model.
+    """
+    cached = lookup_query_embedding(query)
+    if cached is not None:
+        return torch.from_numpy(cached).unsqueeze(0)
+    return get_encoder().encode(query)
@@ -0,0 +1,325 @@
+"""
+Bulk ingest of recipe CSVs into a running system.
+
+The CSV is streamed in chunks. Each chunk is deduplicated on the recipe
+name, matched against existing recipes with one query, and written with a
+single multi-row INSERT for new recipes plus one executemany UPDATE for
+changed ones. Only the ids that were actually inserted or changed are then
+pushed into the Whoosh index, the single and multi-vector embeddings and
+the neighbour table of a new snapshot generation, which is published once
+it passes verification.
+
+Any of the CSV layouts in db/ is accepted; columns missing from a file
+(e.g. Type in detailed_recipes.csv) are left untouched on existing recipes.
+
+    python -m app.ingest db/detailed_recipes.csv --chunk-size 1000
+"""
+import os
+import csv
+import time
+import argparse
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import select, insert, update, bindparam
+
+from .extensions import db
+from .models import Recipe
+from .search_preprocessing import parse_ingredients
+
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 1000))
+# Required in the X-Admin-Token header by the API endpoint; unset disables it
+INGEST_TOKEN = os.environ.get('INGEST_TOKEN', '')
+
+# Recipe column -> accepted CSV headers
+FIELD_ALIASES = {
+    'name': ('Name',),
+    'type': ('Type',),
+    'kitchen': ('Kitchen',),
+    'recipe_text': ('Recipe',),
+    'ingredient_num': ('Ingredient_num',),
+    'portion_num': ('Portion_num',),
+    'time': ('Time',),
+    'likes': ('Likes',),
+    'dislikes': ('Dislikes',),
+    'bookmarks': ('Bookmarks',),
+    'ingredients': ('Ingredients',),
+    'text': ('Text', 'Recipe Text'),
+}
+INT_FIELDS = {'ingredient_num', 'portion_num', 'likes', 'dislikes', 'bookmarks'}
+# Counters belong to the live system once a recipe exists; the CSV only seeds them
+COUNTER_FIELDS = {'likes', 'dislikes', 'bookmarks'}
+# VARCHAR widths from db/init.sql
+VARCHAR_LIMITS = {'name': 255, 'type': 100, 'kitchen': 100, 'time': 50}
+
+_existing_by_names = select(
+    Recipe.id, Recipe.name, *[getattr(Recipe, f) for f in FIELD_ALIASES if f not in COUNTER_FIELDS | {'name'}]
+).where(Recipe.name.in_(bindparam('names', expanding=True)))
+
+
+def is_ingest_authorized(token: Optional[str]) -> bool:
+    return bool(INGEST_TOKEN) and token == INGEST_TOKEN
+
+
+def name_key(name: str) -> str:
+    """
+    Key recipes are deduplicated on: the name with runs of whitespace collapsed.
+
+    Names are stored in this form, so the key is exactly what the name
+    lookup in the database finds. It stays case-sensitive, since an
+    equality lookup cannot match case variants on every backend.
+    """
+    return ' '.join(name.split())
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve_columns(header: List[str]) -> Dict[str, str]:
+    columns = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                columns[field] = alias
+                break
+    if 'name' not in columns:
+        raise ValueError(f"CSV has no Name column (header: {header})")
+    return columns
+
+
+def _parse_row(row: Dict[str, str], columns: Dict[str, str]) -> Optional[Dict]:
+    """CSV row -> recipe column values; empty cells are left out."""
+    record = {}
+    for field, column in columns.items():
+        value = (row.get(column) or '').strip()
+        if not value:
+            continue
+        if field in INT_FIELDS:
+            value = _int(value)
+            if value is None:
+                continue
+        elif field in VARCHAR_LIMITS:
+            if field == 'name':
+                value = name_key(value)
+            value = value[:VARCHAR_LIMITS[field]]
+        record[field] = value
+    if not record.get('name'):
+        return None
+
+    # Parse the ingredient list once and store it in the canonical list-literal form
+    if 'ingredients' in record:
+        items = parse_ingredients(record['ingredients'])
+        record['ingredients'] = str(items)
+        record.setdefault('ingredient_num', len(items))
+    return record
+
+
+def read_chunks(path: str, chunk_size: int = INGEST_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """
+    Streams parsed recipe records from a CSV, chunk_size rows at a time.
+
+    Rows without a name come through as None so they can be counted.
+    """
+    csv.field_size_limit(1 << 30)
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = _resolve_columns(reader.fieldnames or [])
+        chunk = []
+        for row in reader:
+            chunk.append(_parse_row(row, columns))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def upsert_chunk(records: List[Optional[Dict]], stats: Dict, seen: Set[str]) -> List[int]:
+    """
+    Writes one chunk: multi-row INSERT for new names, executemany UPDATE for changed ones.
+
+    The first row for a name in the file wins; later ones are counted as
+    duplicates. Unchanged recipes are not written.
+
+    Args:
+        records: Parsed rows of the chunk
+        stats: Counters updated in place
+        seen: Name keys of earlier rows of the same file, updated in place
+
+    Returns:
+        Ids of recipes that were inserted or changed
+    """
+    stats['rows'] += len(records)
+    unique: Dict[str, Dict] = {}
+    for record in records:
+        if record is None:
+            stats['skipped'] += 1
+            continue
+        key = name_key(record['name'])
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(key)
+        unique[key] = record
+    if not unique:
+        return []
+
+    existing = {}
+    rows = db.session.execute(_existing_by_names, {'names': [r['name'] for r in unique.values()]})
+    for row in rows.mappings():
+        # The lowest id stands for a name that is already duplicated in the table
+        key = name_key(row['name'])
+        if key in unique and (key not in existing or row['id'] < existing[key]['id']):
+            existing[key] = row
+
+    to_insert, to_update = [], []
+    for key, record in unique.items():
+        current = existing.get(key)
+        if current is None:
+            to_insert.append({field: record.get(field) for field in FIELD_ALIASES})
+            for field in COUNTER_FIELDS:
+                to_insert[-1][field] = to_insert[-1][field] or 0
+            continue
+        changes = {
+            field: value for field, value in record.items()
+            if field not in COUNTER_FIELDS and field != 'name' and current[field] != value
+        }
+        if changes:
+            to_update.append({'id': current['id'], **changes})
+        else:
+            stats['unchanged'] += 1
+
+    if to_insert:
+        db.session.execute(insert(Recipe.__table__).values(to_insert))
+    if to_update:
+        db.session.execute(update(Recipe), to_update)
+    db.session.commit()
+
+    # Multi-row INSERT only reports one id, so the new ones are looked up by name
+    inserted_ids = []
+    if to_insert:
+        rows = db.session.execute(_existing_by_names, {'names': [r['name'] for r in to_insert]})
+        new_keys = {name_key(r['name']) for r in to_insert}
+        new_ids = {}
+        for row in rows.mappings():
+            key = name_key(row['name'])
+            if key in new_keys and key not in existing:
+                new_ids[key] = min(new_ids.get(key, row['id']), row['id'])
+        inserted_ids = list(new_ids.values())
+
+    stats['inserted'] += len(inserted_ids)
+    stats['updated'] += len(to_update)
+    return inserted_ids + [r['id'] for r in to_update]
+
+
+def refresh_search_artifacts(recipe_ids: List[int]) -> Dict[str, float]:
+    """
+    Pushes inserted or changed recipes into a new snapshot generation and publishes it.
+
+    The generation starts as a copy of the current one, so only the affected
+    recipes are re-indexed and re-encoded. If nothing was published yet,
+    ensure_preprocessed_data() builds everything from the full table later.
+
+    Returns:
+        Seconds spent per artifact, plus manifest, verification and publishing
+    """
+    from .search_preprocessing import update_whoosh_index, update_embeddings
+    from .spelling import create_spelling_index
+    from .neighbours import update_neighbours
+    from .multivector import update_multivector
+    from .suggest import create_suggest_index
+    from .snapshots import active_generation, new_generation
+
+    timings = {}
+    if not recipe_ids or active_generation() is None:
+        return timings
+
+    build_start = time.perf_counter()
+    with new_generation():
+        start = time.perf_counter()
+        ix = update_whoosh_index(recipe_ids)
+        # New words must become known to the spelling corrector
+        create_spelling_index(ix)
+        timings['whoosh_index'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        update_embeddings(recipe_ids)
+        timings['embeddings'] = time.perf_counter() - start
+        start = time.perf_counter()
+        update_multivector(recipe_ids)
+        timings['multivector'] = time.perf_counter() - start
+        start = time.perf_counter()
+        update_neighbours(recipe_ids)
+        timings['neighbours'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        create_suggest_index()
+        timings['suggest'] = time.perf_counter() - start
+    timings['publish'] = time.perf_counter() - build_start - sum(timings.values())
+    return timings
+
+
+def ingest_csv(path: str, chunk_size: int = INGEST_CHUNK_SIZE, refresh: bool = True) -> Dict:
+    """
+    Upserts every recipe of a CSV and refreshes the search artifacts for the affected ids.
+
+    Must run inside a Flask application context.
+
+    Args:
+        path: CSV in any of the layouts found in db/
+        chunk_size: Rows per INSERT/UPDATE round trip
+        refresh: Update the index, embeddings and neighbours afterwards
+
+    Returns:
+        Report with row counts, affected ids, timings and rows/sec
+    """
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0, 'skipped': 0}
+    affected = []
+    seen = set()
+    start = time.perf_counter()
+    for chunk in read_chunks(path, chunk_size):
+        affected.extend(upsert_chunk(chunk, stats, seen))
+    db_seconds = time.perf_counter() - start
+    refresh_timings = refresh_search_artifacts(affected) if refresh else {}
+    total_seconds = time.perf_counter() - start
+
+    return {
+        **stats,
+        'affected_ids': affected,
+        'db_seconds': db_seconds,
+        'refresh_seconds': refresh_timings,
+        'total_seconds': total_seconds,
+        'rows_per_sec': stats['rows'] / db_seconds if db_seconds else 0.0,
+        'rows_per_sec_with_refresh': stats['rows'] / total_seconds if total_seconds else 0.0,
+    }
+
+
+def print_report(report: Dict):
+    print(f"Rows read: {report['rows']} (inserted {report['inserted']}, updated {report['updated']}, "
+          f"unchanged {report['unchanged']}, duplicate names {report['duplicates']}, "
+          f"skipped {report['skipped']})")
+    print(f"Database: {report['db_seconds']:.2f}s, {report['rows_per_sec']:.0f} rows/sec")
+    for artifact, seconds in report['refresh_seconds'].items():
+        print(f"Refresh {artifact}: {seconds:.2f}s")
+    print(f"Total: {report['total_seconds']:.2f}s, {report['rows_per_sec_with_refresh']:.0f} rows/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-ingest a recipe CSV')
+    parser.add_argument('csv', help='Recipe CSV (final_recipess.csv, detailed_recipes.csv, recipe_data.csv layouts)')
+    parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument('--no-refresh', action='store_true',
+                        help='Skip updating the search index, embeddings and neighbours')
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        print_report(ingest_csv(args.csv, args.chunk_size, refresh=not args.no_refresh))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Recipe, Interaction
+from .leaderboard import increment_interaction_count
+
+
+def _bump(column, delta: int):
+    """SQL expression that adds delta to a counter column without going below zero."""
+    value = func.coalesce(column, 0) + delta
+    return case((value < 0, 0), else_=value)
+
+
+def record_interaction(user_id: int, recipe_id: int, action: str) -> Interaction:
+    """
+    Applies a like/dislike/bookmark toggle and updates the recipe counters atomically.
+
+    A first interaction is inserted under the unique (user_id, recipe_id)
+    index, so of two concurrent first clicks only one creates the row; the
+    row is then locked for the duration of the transaction so concurrent
+    clicks by the same user cannot double-count, and counters are
+    changed with a single UPDATE ... SET likes = likes + 1 instead of a Python
+    read-modify-write, so concurrent users never overwrite each other.
+
+    Args:
+        user_id: Id of the interacting user
+        recipe_id: Id of the recipe
+        action: One of 'like', 'dislike', 'bookmark'
+
+    Returns:
+        The updated Interaction (committed)
+    """
+    existing = Interaction.query.filter_by(user_id=user_id, recipe_id=recipe_id)
+    created = False
+    # Locking a row that does not exist yet locks nothing, so the row is created first
+    if existing.first() is None:
+        try:
+            with db.session.begin_nested():
+                # liked=None means "no vote"; the column default of False would read as a dislike
+                db.session.add(Interaction(user_id=user_id, recipe_id=recipe_id, liked=None))
+            created = True
+        except IntegrityError:
+            pass  # A concurrent click inserted it first
+    interaction = existing.with_for_update().one()
+    if created:
+        increment_interaction_count(user_id)
+
+    deltas = {'likes': 0, 'dislikes': 0, 'bookmarks': 0}
+
+    if action == 'like':
+        if not interaction.liked:  # If not liked
+            deltas['likes'] += 1
+            if interaction.liked is False:  # If switching from dislike
+                deltas['dislikes'] -= 1
+            interaction.liked = True
+        else:  # Undo like
+            deltas['likes'] -= 1
+            interaction.liked = None
+
+    elif action == 'dislike':
+        if interaction.liked is not False:  # If not disliked
+            deltas['dislikes'] += 1
+            if interaction.liked:  # If switching from like
+                deltas['likes'] -= 1
+            interaction.liked = False
+        else:  # Undo dislike
+            deltas['dislikes'] -= 1
+            interaction.liked = None
+
+    elif action == 'bookmark':
+        if not interaction.bookmarked:  # Bookmark the recipe
+            deltas['bookmarks'] += 1
+            interaction.bookmarked = True
+        else:  # Undo bookmark
+            deltas['bookmarks'] -= 1
+            interaction.bookmarked = False
+
+    values = {
+        getattr(Recipe, field): _bump(getattr(Recipe, field), delta)
+        for field, delta in deltas.items() if delta
+    }
+    if values:
+        Recipe.query.filter_by(id=recipe_id).update(values, synchronize_session=False)
+
+    db.session.commit()
+    return interaction
@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+import argparse
+from typing import List, Dict
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from .extensions import db
+from .models import Interaction, UserInteractionCount
+
+logger = logging.getLogger(__name__)
+
+# Pause between runs of `python -m app.leaderboard reconcile --every`
+RECONCILE_INTERVAL = int(os.environ.get('LEADERBOARD_RECONCILE_SECONDS', 3600))
+
+
+def ensure_leaderboard():
+    """
+    Creates the leaderboard table and interaction indexes if they are missing.
+
+    The counts are only built from the interactions table when the
+    leaderboard is empty; drift is repaired by `python -m app.leaderboard
+    reconcile --every N`, which docker-compose runs as the leaderboard service.
+    """
+    engine = db.engine
+    UserInteractionCount.__table__.create(bind=engine, checkfirst=True)
+    for index in Interaction.__table__.indexes:
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except DBAPIError as e:
+            # A unique index cannot be added while duplicate rows exist
+            logger.error(f"Could not create index {index.name}: {e}")
+    if db.session.execute(text("SELECT 1 FROM user_interaction_counts LIMIT 1")).first() is None:
+        reconcile_leaderboard()
+
+
+def reconcile_leaderboard():
+    """Rebuilds the materialized per-user counts from the interactions table."""
+    db.session.execute(text("DELETE FROM user_interaction_counts"))
+    db.session.execute(text("""
+        INSERT INTO user_interaction_counts (user_id, total_interactions)
+        SELECT user_id, COUNT(id)
+        FROM interactions
+        GROUP BY user_id
+    """))
+    db.session.commit()
+    logger.info("Leaderboard reconciled with interactions table")
+
+
+def increment_interaction_count(user_id: int):
+    """
+    Adds one interaction to a user's materialized count.
+
+    Runs inside the caller's transaction, so the count is committed
+    together with the new interaction row.
+    """
+    updated = (UserInteractionCount.query
+               .filter_by(user_id=user_id)
+               .update({UserInteractionCount.total_interactions:
+                        UserInteractionCount.total_interactions + 1},
+                       synchronize_session=False))
+    if not updated:
+        db.session.add(UserInteractionCount(user_id=user_id, total_interactions=1))
+
+
+def top_users(limit: int = 10) -> List[Dict]:
+    """
+    Returns the most active users.
+
+    Reads the top rows of the total_interactions index, so the cost does not
+    depend on how many interactions exist.
+    """
+    query = text("""
+        SELECT
+            users.username AS username,
+            user_interaction_counts.total_interactions AS total_interactions
+        FROM
+            user_interaction_counts
+        INNER JOIN
+            users
+        ON
+            users.id = user_interaction_counts.user_id
+        WHERE
+            user_interaction_counts.total_interactions > 0
+        ORDER BY
+            user_interaction_counts.total_interactions DESC
+        LIMIT :limit
+    """)
+    result = db.session.execute(query, {"limit": limit}).fetchall()
+    return [{"username": row.username, "total_interactions": row.total_interactions} for row in result]
+
+
+def reconcile_periodically(interval: int = RECONCILE_INTERVAL):
+    """Reconciles every `interval` seconds; a failed run is logged and retried on the next one."""
+    while True:
+        try:
+            reconcile_leaderboard()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Leaderboard reconciliation failed")
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the materialized leaderboard')
+    sub = parser.add_subparsers(dest='command', required=True)
+    reconcile = sub.add_parser('reconcile', help='Rebuild the per-user counts from the interactions table')
+    reconcile.add_argument('--every', type=int, nargs='?', const=RECONCILE_INTERVAL, default=None,
+                           help=f'Repeat every N seconds (default {RECONCILE_INTERVAL}) instead of running once')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Only the database is needed, not the search artifacts create_app() builds
+    from flask import Flask
+    from .config import Config
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        ensure_leaderboard()
+        if args.every:
+            reconcile_periodically(args.every)
+        else:
+            reconcile_leaderboard()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Upper bounds in milliseconds, Prometheus-style cumulative buckets
+DEFAULT_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Fraction of requests whose spans are aggregated; debug requests are always timed
+SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram of durations in milliseconds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+def _escape_label(value) -> str:
+    """Label value escaped as the text exposition format requires."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """Collection of labelled histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str = '', **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help_text)
+        return histogram
+
+    def render(self) -> str:
+        lines = []
+        seen = set()
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total, count = histogram.snapshot()
+            label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{name}_sum{suffix} {total}')
+            lines.append(f'{name}_count{suffix} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class SearchSpans:
+    """
+    Per-request stage timer for the search hot path.
+
+    Usage:
+        spans = SearchSpans('api', 'bm25', debug=debug)
+        with spans.stage('parse'):
+            ...
+        spans.finish()
+        spans.timings  # {'parse': 0.12, ..., 'total': 3.4} in milliseconds
+
+    Only sampled requests are aggregated into the registry, and unsampled,
+    non-debug requests skip timing entirely.
+    """
+
+    def __init__(self, service: str, method: str, debug: bool = False):
+        self.service = service
+        self.method = method
+        self.sampled = random.random() < SAMPLE_RATE
+        self.enabled = debug or self.sampled
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def finish(self) -> Dict[str, float]:
+        """Records total time and, if sampled, feeds every stage into the histograms."""
+        self.timings['total'] = (time.perf_counter() - self._start) * 1000
+        if self.sampled:
+            for stage, elapsed in self.timings.items():
+                registry.histogram(
+                    'search_stage_duration_ms', 'Duration of search stages in milliseconds',
+                    service=self.service, method=self.method, stage=stage,
+                ).observe(elapsed)
+        return self.timings
+
+
+def render_metrics() -> str:
+    """Returns all collected metrics in the Prometheus text exposition format."""
+    return registry.render()
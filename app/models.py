@@ -39,4 +39,21 @@ class Interaction(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
     liked = db.Column(db.Boolean, default=False)
-    bookmarked = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    bookmarked = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (
+        # One row per (user, recipe); also covers lookups by user_id alone
+        db.Index('uq_interactions_user_recipe', 'user_id', 'recipe_id', unique=True),
+    )
+
+
+class UserInteractionCount(db.Model):
+    """Materialized per-user interaction count backing the leaderboard."""
+
+    __tablename__ = 'user_interaction_counts'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    total_interactions = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_user_interaction_counts_total', 'total_interactions'),
+    )
\ No newline at end of file
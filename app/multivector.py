@@ -0,0 +1,226 @@
+"""
+Multi-vector recipe embeddings with field-level scoring.
+
+The single embedding of a recipe is computed from name, ingredients and
+text glued together, and MiniLM truncates that input, so most of a long
+text is never seen. Here every recipe gets one vector for its name, one
+for its ingredient list and one per overlapping chunk of its text. The
+vectors of a recipe are stored contiguously, so a query is scored with
+one matrix-vector product followed by a segment-wise max
+(np.maximum.reduceat) over the recipe boundaries:
+
+- max: best matching vector of the recipe
+- weighted: best matching vector per field, combined with FIELD_WEIGHTS
+  over the fields the recipe has
+"""
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .extensions import db
+from .models import Recipe
+from .search_preprocessing import parse_ingredients
+from .snapshots import artifact_path, on_snapshot_change
+
+MULTIVECTOR_FILE = 'multivector.npz'
+FIELDS = ('name', 'ingredients', 'text')
+FIELD_WEIGHTS = {
+    'name': float(os.environ.get('MULTIVECTOR_NAME_WEIGHT', 0.4)),
+    'ingredients': float(os.environ.get('MULTIVECTOR_INGREDIENTS_WEIGHT', 0.3)),
+    'text': float(os.environ.get('MULTIVECTOR_TEXT_WEIGHT', 0.3)),
+}
+# all-MiniLM-L6-v2 reads 256 word pieces; 80 Russian words stay below that
+CHUNK_WORDS = int(os.environ.get('MULTIVECTOR_CHUNK_WORDS', 80))
+CHUNK_OVERLAP = int(os.environ.get('MULTIVECTOR_CHUNK_OVERLAP', 20))
+MAX_CHUNKS = int(os.environ.get('MULTIVECTOR_MAX_CHUNKS', 8))
+# Scoring of method=embedding when a request does not choose: single, max or weighted
+EMBEDDING_SCORING = os.environ.get('EMBEDDING_SCORING', 'single')
+
+_store = None
+
+
+def text_chunks(text: str, words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP,
+                max_chunks: int = MAX_CHUNKS) -> List[str]:
+    """Splits text into windows of `words` words that overlap by `overlap` words."""
+    tokens = (text or '').split()
+    step = max(words - overlap, 1)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(' '.join(tokens[start:start + words]))
+        if start + words >= len(tokens) or len(chunks) >= max_chunks:
+            break
+    return chunks
+
+
+def recipe_segments(recipe) -> List[Tuple[int, str]]:
+    """
+    (field code, text) pairs a recipe is embedded from, grouped by field.
+
+    The name is always present, so every recipe has at least one vector.
+    """
+    segments = [(0, recipe.name or '')]
+    ingredients = parse_ingredients(recipe.ingredients)
+    if ingredients:
+        segments.append((1, ', '.join(ingredients)))
+    segments.extend((2, chunk) for chunk in text_chunks(recipe.text))
+    return segments
+
+
+def _encode_recipes(recipes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (segment counts per recipe, field codes, normalized vectors) for the recipes."""
+    from .encoder import get_encoder
+
+    counts, fields, texts = [], [], []
+    for recipe in recipes:
+        segments = recipe_segments(recipe)
+        counts.append(len(segments))
+        fields.extend(field for field, _ in segments)
+        texts.extend(text for _, text in segments)
+    vectors = get_encoder().encode(texts).cpu().numpy() if texts else np.empty((0, 0), dtype=np.float32)
+    return np.asarray(counts, dtype=np.int64), np.asarray(fields, dtype=np.int8), vectors
+
+
+def create_multivector():
+    """Encodes the segments of every recipe and saves them to MULTIVECTOR_FILE."""
+    print("Creating multi-vector embeddings...")
+    recipes = Recipe.query.order_by(Recipe.id).all()
+    counts, fields, vectors = _encode_recipes(recipes)
+    ids = np.asarray([r.id for r in recipes], dtype=np.int32)
+    save_multivector(ids, counts, fields, vectors)
+    print(f"Multi-vector embeddings created: {len(vectors)} vectors for {len(ids)} recipes.")
+
+
+def update_multivector(recipe_ids: List[int]):
+    """
+    Replaces the vectors of inserted or changed recipes.
+
+    Args:
+        recipe_ids: Ids of recipes that were inserted or changed
+    """
+    from .queries import fetch_recipes_by_ids
+
+    if not os.path.exists(artifact_path(MULTIVECTOR_FILE)):
+        create_multivector()
+        return
+
+    ids, offsets, fields, vectors = _read(artifact_path(MULTIVECTOR_FILE))
+    recipes = fetch_recipes_by_ids(db.session, recipe_ids)
+    counts, new_fields, new_vectors = _encode_recipes(recipes)
+
+    # Drop the old segments of the affected recipes, then append the new ones
+    keep = ~np.isin(ids, [r.id for r in recipes])
+    keep_segments = np.repeat(keep, np.diff(offsets))
+    if len(new_vectors):
+        vectors = np.concatenate([vectors[keep_segments], new_vectors.astype(vectors.dtype)])
+    else:
+        vectors = vectors[keep_segments]
+    save_multivector(
+        np.concatenate([ids[keep], np.asarray([r.id for r in recipes], dtype=np.int32)]),
+        np.concatenate([np.diff(offsets)[keep], counts]),
+        np.concatenate([fields[keep_segments], new_fields]),
+        vectors,
+    )
+    print(f"Multi-vector embeddings updated for {len(recipes)} recipes.")
+
+
+def save_multivector(ids: np.ndarray, counts: np.ndarray, fields: np.ndarray, vectors: np.ndarray):
+    """Writes int32 ids, segment offsets and field codes, and float16 vectors."""
+    tmp_file = artifact_path(MULTIVECTOR_FILE) + '.tmp.npz'
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    np.savez(
+        tmp_file,
+        ids=ids.astype(np.int32),
+        offsets=offsets,
+        fields=fields.astype(np.int8),
+        vectors=vectors.astype(np.float16),
+    )
+    os.replace(tmp_file, artifact_path(MULTIVECTOR_FILE))
+    _reset()
+
+
+def _read(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    data = np.load(path)
+    return data['ids'], data['offsets'], data['fields'], data['vectors']
+
+
+def load_multivector() -> Dict:
+    """
+    Loads the vector store once per process.
+
+    Vectors are kept as float32, which BLAS multiplies much faster than the
+    float16 stored on disk. Besides the arrays from the file, the store
+    holds the boundaries of every (recipe, field) group for weighted scoring.
+    """
+    global _store
+    if _store is None:
+        path = artifact_path(MULTIVECTOR_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError("Multi-vector embeddings file does not exist.")
+        ids, offsets, fields, vectors = _read(path)
+        owners = np.repeat(np.arange(len(ids)), np.diff(offsets))
+        # A group starts at every recipe boundary and wherever the field changes within a recipe
+        boundaries = (owners[1:] != owners[:-1]) | (fields[1:] != fields[:-1])
+        starts = np.flatnonzero(np.concatenate([[len(owners) > 0], boundaries]))
+        weights = np.asarray([FIELD_WEIGHTS[f] for f in FIELDS], dtype=np.float32)
+        group_owners = owners[starts]
+        group_weights = weights[fields[starts]]
+        _store = {
+            'ids': ids,
+            'offsets': offsets,
+            'vectors': vectors.astype(np.float32),
+            'group_starts': starts,
+            'group_owners': group_owners,
+            'group_weights': group_weights,
+            'weight_totals': np.bincount(group_owners, weights=group_weights, minlength=len(ids)),
+        }
+    return _store
+
+
+def _reset():
+    global _store
+    _store = None
+
+
+on_snapshot_change(_reset)
+
+
+def score_recipes(query_embedding: np.ndarray, mode: str = 'max') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scores every recipe against a normalized query vector.
+
+    Args:
+        query_embedding: Query vector (D,)
+        mode: 'max' or 'weighted'
+
+    Returns:
+        (recipe ids, scores) aligned arrays
+    """
+    store = load_multivector()
+    if not len(store['ids']):
+        return store['ids'], np.empty(0, dtype=np.float32)
+    sims = store['vectors'] @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    if mode == 'max':
+        return store['ids'], np.maximum.reduceat(sims, store['offsets'][:-1])
+    if mode != 'weighted':
+        raise ValueError(f"Unknown multi-vector scoring mode: {mode}")
+    group_max = np.maximum.reduceat(sims, store['group_starts'])
+    totals = np.bincount(store['group_owners'], weights=group_max * store['group_weights'],
+                         minlength=len(store['ids']))
+    return store['ids'], (totals / store['weight_totals']).astype(np.float32)
+
+
+def search_multivector(query_embedding: np.ndarray, k: int, mode: str = 'max') -> List[Tuple[int, float]]:
+    """
+    Returns the top-k recipes for a query vector.
+
+    Returns:
+        List of (recipe_id, score) pairs, best first
+    """
+    ids, scores = score_recipes(query_embedding, mode)
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(int(ids[i]), float(scores[i])) for i in top]
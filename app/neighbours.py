@@ -0,0 +1,205 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .search_preprocessing import load_embeddings
+from .snapshots import artifact_path, on_snapshot_change
+
+NEIGHBOURS_FILE = 'neighbours.npz'
+DEFAULT_TOP_K = 20
+DEFAULT_BLOCK_SIZE = 1024
+
+_neighbour_table = None
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Returns L2-normalized float32 copy of the embedding matrix."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _block_top_k(queries: np.ndarray, corpus: np.ndarray, k: int,
+                 query_offset: Optional[int] = None,
+                 block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the top-k corpus rows for every query row, one block of queries at a time.
+
+    Only a (block_size x N) slice of the similarity matrix is alive at once,
+    so memory stays bounded regardless of corpus size.
+
+    Args:
+        queries: Normalized query vectors (M x D)
+        corpus: Normalized corpus vectors (N x D)
+        k: Number of neighbours per query
+        query_offset: Row of the first query inside corpus, used to exclude self-matches
+        block_size: Number of query rows scored per matrix multiplication
+
+    Returns:
+        Tuple of (indices int32 M x k, scores float32 M x k), sorted by score descending
+    """
+    n_queries, n_corpus = len(queries), len(corpus)
+    k = min(k, n_corpus - 1 if query_offset is not None else n_corpus)
+    indices = np.empty((n_queries, max(k, 0)), dtype=np.int32)
+    scores = np.empty((n_queries, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    for start in range(0, n_queries, block_size):
+        stop = min(start + block_size, n_queries)
+        sims = queries[start:stop] @ corpus.T
+
+        if query_offset is not None:
+            rows = np.arange(stop - start)
+            sims[rows, query_offset + start + rows] = -np.inf
+
+        # argpartition is O(N) per row; only the k survivors get sorted
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+
+        indices[start:stop] = np.take_along_axis(part, order, axis=1)
+        scores[start:stop] = np.take_along_axis(part_scores, order, axis=1)
+
+    return indices, scores
+
+
+def create_neighbours(k: int = DEFAULT_TOP_K, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Precomputes top-k similar recipes for every recipe and saves them to NEIGHBOURS_FILE.
+
+    Args:
+        k: Number of neighbours stored per recipe
+        block_size: Number of recipes scored per matrix multiplication
+    """
+    print("Computing recipe-to-recipe neighbours...")
+    recipe_ids, embeddings = load_embeddings()
+    embeddings = _normalize(embeddings)
+
+    indices, scores = _block_top_k(embeddings, embeddings, k,
+                                   query_offset=0, block_size=block_size)
+    ids = np.asarray(recipe_ids, dtype=np.int32)
+    save_neighbours(ids, ids[indices], scores)
+    print(f"Neighbours computed for {len(ids)} recipes (k={indices.shape[1]}).")
+
+
+def update_neighbours(new_ids: List[int], block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Incrementally adds recipes to the neighbour table.
+
+    New recipes are scored against the whole corpus; existing recipes only
+    need to be scored against the new ones and merged with their current lists.
+    Must be called after the embeddings file already contains the new recipes.
+
+    Args:
+        new_ids: Ids of the recipes that were added (or whose text changed)
+        block_size: Number of recipes scored per matrix multiplication
+    """
+    if not os.path.exists(artifact_path(NEIGHBOURS_FILE)):
+        create_neighbours(block_size=block_size)
+        return
+
+    recipe_ids, embeddings = load_embeddings()
+    embeddings = _normalize(embeddings)
+    all_ids = np.asarray(recipe_ids, dtype=np.int32)
+    id_to_row = {int(rid): row for row, rid in enumerate(all_ids)}
+
+    old = np.load(artifact_path(NEIGHBOURS_FILE))
+    old_ids, old_neighbours, old_scores = old['ids'], old['neighbours'], old['scores']
+    k = old_neighbours.shape[1]
+
+    new_ids = np.asarray(new_ids, dtype=np.int32)
+    new_set = set(new_ids.tolist())
+
+    # Full neighbour lists for the new recipes
+    new_rows = np.array([id_to_row[int(rid)] for rid in new_ids], dtype=np.int64)
+    new_embeddings = embeddings[new_rows]
+    sims_idx, sims_scores = _block_top_k(new_embeddings, embeddings, k + 1, block_size=block_size)
+    new_neighbours = np.empty((len(new_ids), k), dtype=np.int32)
+    new_scores = np.empty((len(new_ids), k), dtype=np.float32)
+    for i, row in enumerate(new_rows):
+        keep = sims_idx[i] != row
+        new_neighbours[i] = all_ids[sims_idx[i][keep][:k]]
+        new_scores[i] = sims_scores[i][keep][:k]
+
+    # Existing recipes: merge their stored list with candidates from the new ones
+    kept = np.array([rid not in new_set and rid in id_to_row for rid in old_ids.tolist()], dtype=bool)
+    old_ids, old_neighbours, old_scores = old_ids[kept], old_neighbours[kept], old_scores[kept].astype(np.float32)
+    if len(old_ids):
+        old_vectors = embeddings[[id_to_row[int(rid)] for rid in old_ids]]
+        cand_idx, cand_scores = _block_top_k(old_vectors, new_embeddings, k, block_size=block_size)
+        # Drop stale entries pointing at re-added recipes before merging
+        stale = np.isin(old_neighbours, new_ids)
+        old_scores[stale] = -np.inf
+        merged_ids = np.concatenate([old_neighbours, new_ids[cand_idx]], axis=1)
+        merged_scores = np.concatenate([old_scores, cand_scores], axis=1)
+        order = np.argsort(-merged_scores, axis=1)[:, :k]
+        old_neighbours = np.take_along_axis(merged_ids, order, axis=1)
+        old_scores = np.take_along_axis(merged_scores, order, axis=1)
+
+    save_neighbours(
+        np.concatenate([old_ids, new_ids]),
+        np.concatenate([old_neighbours, new_neighbours]),
+        np.concatenate([old_scores, new_scores]),
+    )
+    print(f"Neighbour table updated with {len(new_ids)} recipes.")
+
+
+def save_neighbours(ids: np.ndarray, neighbours: np.ndarray, scores: np.ndarray):
+    """Writes the neighbour table as int32 ids and float16 scores."""
+    global _neighbour_table
+    tmp_file = artifact_path(NEIGHBOURS_FILE) + '.tmp.npz'
+    np.savez(
+        tmp_file,
+        ids=ids.astype(np.int32),
+        neighbours=neighbours.astype(np.int32),
+        scores=scores.astype(np.float16),
+    )
+    os.replace(tmp_file, artifact_path(NEIGHBOURS_FILE))
+    _neighbour_table = None
+
+
+def load_neighbours():
+    """
+    Loads the neighbour table, caching it for the lifetime of the process.
+
+    Returns:
+        Tuple of (id -> row dict, neighbours int32 array, scores float16 array)
+    """
+    global _neighbour_table
+    if _neighbour_table is None:
+        neighbours_file = artifact_path(NEIGHBOURS_FILE)
+        if not os.path.exists(neighbours_file):
+            raise FileNotFoundError("Neighbours file does not exist.")
+        data = np.load(neighbours_file)
+        id_to_row = {int(rid): row for row, rid in enumerate(data['ids'])}
+        _neighbour_table = (id_to_row, data['neighbours'], data['scores'])
+    return _neighbour_table
+
+
+def _reset():
+    global _neighbour_table
+    _neighbour_table = None
+
+
+on_snapshot_change(_reset)
+
+
+def get_similar_recipes(recipe_id: int, limit: int = 10) -> List[Tuple[int, float]]:
+    """
+    Returns precomputed similar recipes for a recipe.
+
+    Args:
+        recipe_id: Recipe to look up
+        limit: Maximum number of neighbours to return
+
+    Returns:
+        List of (recipe_id, cosine similarity) pairs, most similar first
+    """
+    id_to_row, neighbours, scores = load_neighbours()
+    row = id_to_row.get(recipe_id)
+    if row is None:
+        return []
+    return [(int(n), float(s)) for n, s in zip(neighbours[row, :limit], scores[row, :limit])]
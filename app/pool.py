@@ -0,0 +1,86 @@
+import time
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from .config import DATABASE_URL, engine_options
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that counts how often and how long callers wait for a connection.
+
+    Checked-out and overflow numbers come from QueuePool itself; waits and
+    timeouts are only visible at checkout time, so they are tracked here.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                # Anything slower than a millisecond had to wait for a connection or open one
+                if waited > 0.001:
+                    self.waits += 1
+                    self.wait_time += waited
+
+
+def create_db_engine(database_url: str = DATABASE_URL):
+    """
+    Create an engine with the pool settings shared by both services.
+
+    Args:
+        database_url: Database connection URL
+
+    Returns:
+        SQLAlchemy engine
+    """
+    return create_engine(database_url, **engine_options(database_url))
+
+
+def pool_status(engine) -> dict:
+    """
+    Returns a snapshot of the connection pool of an engine.
+
+    Args:
+        engine: SQLAlchemy engine
+
+    Returns:
+        Dictionary with pool size, checked-out connections, overflow and wait counters
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+
+    status = {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'max_overflow': pool._max_overflow,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update({
+            'checkouts': pool.checkouts,
+            'waits': pool.waits,
+            'wait_time_ms': pool.wait_time * 1000,
+            'timeouts': pool.timeouts,
+        })
+    return status
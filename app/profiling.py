@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Nothing below runs unless PROFILING_ENABLED=1 and the caller knows PROFILING_TOKEN
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/recipe_profiles')
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1.0)) / 1000
+
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Profile-Token'
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """True if profiling is switched on and the token matches."""
+    return PROFILING_ENABLED and bool(PROFILING_TOKEN) and token == PROFILING_TOKEN
+
+
+class StackSampler:
+    """
+    Sampling profiler for a set of threads.
+
+    A background thread reads the current frame of every target thread each
+    SAMPLE_INTERVAL seconds and counts the call stacks it sees. Threadpool
+    workers join and leave the set while they run a part of the request.
+    The result is written in the folded format understood by flamegraph.pl
+    and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def add_thread(self, thread_id: int):
+        with self._lock:
+            self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            self.thread_ids.discard(thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self.thread_ids)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _output_path(kind: str, label: str, extension: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_') or 'request'
+    return os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{kind}-{safe_label}.{extension}")
+
+
+# Profiler of the current request: a StackSampler, or the list of cProfile
+# profilers whose stats are merged into the output. run_in_threadpool copies
+# the context, so threadpool workers see the request's profiler as well.
+_active_profile: ContextVar = ContextVar('active_profile', default=None)
+# cProfile on the event loop thread serves one request at a time; Python 3.12+ allows one per process
+_cprofile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(kind: str, label: str):
+    """
+    Runs the enclosed block under a profiler and yields a dict that gets the output path.
+
+    Only the calling thread is profiled; work the request hands to the
+    threadpool is covered by wrapping it with profile_thread(). Only one
+    cProfile profile runs at a time: while one is active, or when another
+    profiler holds the interpreter, the block runs unprofiled and the path
+    stays None.
+
+    Args:
+        kind: 'cprofile' (deterministic, .prof for snakeviz/pstats or flameprof)
+              or 'sample' (statistical, folded stacks for flamegraph.pl/speedscope)
+        label: Used in the output file name
+    """
+    output = {}
+    if kind == 'sample':
+        sampler = StackSampler(threading.get_ident())
+        token = _active_profile.set(sampler)
+        sampler.start()
+        try:
+            yield output
+        finally:
+            _active_profile.reset(token)
+            sampler.stop()
+            output['path'] = _output_path(kind, label, 'folded')
+            sampler.write_folded(output['path'])
+    else:
+        output['path'] = None
+        if not _cprofile_lock.acquire(blocking=False):
+            logger.warning(f"Not profiling {label}: another cProfile profile is running")
+            yield output
+            return
+        try:
+            profiler = cProfile.Profile()
+            profilers = [profiler]
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ refuses a second profiler, e.g. one started outside the app
+                logger.warning(f"Not profiling {label}: another profiler is active")
+                yield output
+                return
+            token = _active_profile.set(profilers)
+            try:
+                yield output
+            finally:
+                profiler.disable()
+                _active_profile.reset(token)
+                output['path'] = _output_path('cprofile', label, 'prof')
+                pstats.Stats(*profilers).dump_stats(output['path'])
+        finally:
+            _cprofile_lock.release()
+    logger.info(f"Profile written to {output['path']}")
+
+
+def profile_thread(func):
+    """
+    Wraps a blocking function so that it runs under the request's profiler.
+
+    cProfile and StackSampler only see the thread they were started on, the
+    event loop, so a function passed to run_in_threadpool would be missing
+    from the profile. The wrapper adds the worker thread to the sampler, or
+    runs the function under its own cProfile profiler whose stats are merged
+    into the request's output. Without an active profile it just calls func.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        active = _active_profile.get()
+        if active is None:
+            return func(*args, **kwargs)
+        if isinstance(active, StackSampler):
+            thread_id = threading.get_ident()
+            active.add_thread(thread_id)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                active.remove_thread(thread_id)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from one profiler and refuses a second one
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            active.append(profiler)
+    return wrapper
+
+
+def _os_thread_count() -> Optional[int]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _torch_threads() -> dict:
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return {}
+    return {
+        'torch_intra_op_threads': torch.get_num_threads(),
+        'torch_inter_op_threads': torch.get_num_interop_threads(),
+    }
+
+
+class AllocationWindow:
+    """
+    Tracks allocations and thread usage over the next N requests.
+
+    tracemalloc slows every allocation down, so it is only switched on while
+    a window is open and switched off again when the window closes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.requests = []
+        self.summary = None
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def open(self, n_requests: int):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.remaining = n_requests
+            self.requests = []
+            self.summary = None
+
+    @contextmanager
+    def track(self, label: str):
+        """Measures one request if the window is open."""
+        if not self.active:
+            yield
+            return
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            record = {
+                'request': label,
+                'duration_ms': (time.perf_counter() - start) * 1000,
+                'allocated_bytes': current - before,
+                'peak_bytes': peak - before,
+                'os_threads': _os_thread_count(),
+                **_torch_threads(),
+            }
+            with self._lock:
+                if self.remaining > 0:
+                    self.requests.append(record)
+                    self.remaining -= 1
+                    if self.remaining == 0:
+                        self._close()
+
+    def _close(self):
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        top = snapshot.statistics('lineno')[:20]
+        self.summary = {
+            'requests': len(self.requests),
+            'top_allocations': [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in top
+            ],
+        }
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                'active': self.active,
+                'remaining': self.remaining,
+                'requests': list(self.requests),
+                'summary': self.summary,
+                'os_threads': _os_thread_count(),
+                **_torch_threads(),
+            }
+
+
+allocation_window = AllocationWindow()
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Profiles individual requests on demand.
+
+    A request carrying `X-Profile: cprofile` (or `sample`) and a valid
+    `X-Profile-Token` header runs under that profiler; the response gets an
+    `X-Profile-Output` header with the file path, unless it ran unprofiled
+    because another cProfile profile was active. Requests inside an open
+    allocation window are measured as well. Without PROFILING_ENABLED=1 the
+    middleware only forwards the request.
+    """
+
+    async def dispatch(self, request, call_next):
+        if not PROFILING_ENABLED:
+            return await call_next(request)
+
+        label = request.url.path
+        kind = request.headers.get(PROFILE_HEADER)
+        if kind and is_authorized(request.headers.get(TOKEN_HEADER)):
+            with profiled(kind, label) as output, allocation_window.track(label):
+                response = await call_next(request)
+            if output['path']:
+                response.headers['X-Profile-Output'] = output['path']
+            return response
+
+        with allocation_window.track(label):
+            return await call_next(request)
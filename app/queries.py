@@ -0,0 +1,27 @@
+from typing import List
+
+from sqlalchemy import select, bindparam
+
+from .models import Recipe
+
+# Built once so every call hits the same compiled-statement cache entry;
+# the expanding parameter renders any number of ids without recompiling.
+_recipes_by_ids = select(Recipe).where(Recipe.id.in_(bindparam('ids', expanding=True)))
+
+
+def fetch_recipes_by_ids(session, recipe_ids: List[int]) -> List[Recipe]:
+    """
+    Loads recipes for a ranked list of ids in one query, keeping the given order.
+
+    Args:
+        session: SQLAlchemy session (Flask-SQLAlchemy's db.session or a SessionLocal)
+        recipe_ids: Recipe ids in the desired order
+
+    Returns:
+        List of Recipe objects; ids missing from the database are skipped
+    """
+    if not recipe_ids:
+        return []
+    recipes = session.execute(_recipes_by_ids, {'ids': list(recipe_ids)}).scalars().all()
+    id_to_recipe = {r.id: r for r in recipes}
+    return [id_to_recipe[rid] for rid in recipe_ids if rid in id_to_recipe]
@@ -0,0 +1,170 @@
+"""
+Precomputed embeddings for frequent queries and recipe names.
+
+The table is two .npy files in the snapshot directory: a sorted array of 64-bit
+query hashes and the matching embedding rows. Both are memory-mapped, so a
+lookup is a binary search over the hashes plus one row read, and this module
+does not import torch; workers serving only head queries never load the model.
+"""
+import os
+import json
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .snapshots import artifact_path, on_snapshot_change, new_generation
+
+QUERY_KEYS_FILE = 'query_embeddings_keys.npy'
+QUERY_VECTORS_FILE = 'query_embeddings.npy'
+
+# Append every search query here (JSONL) so the table can be rebuilt from real traffic
+QUERY_LOG_FILE = os.environ.get('QUERY_LOG_FILE')
+DEFAULT_TOP_QUERIES = 10000
+DEFAULT_MIN_COUNT = 2
+
+_table = None
+_log_lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used as the lookup key: lowercased, single-spaced."""
+    return ' '.join(query.lower().split())
+
+
+def query_hash(query: str) -> int:
+    """64-bit hash of the normalized query."""
+    digest = hashlib.blake2b(normalize_query(query).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def log_query(query: str, method: str):
+    """Appends a query to QUERY_LOG_FILE, if configured."""
+    if not QUERY_LOG_FILE:
+        return
+    line = json.dumps({'query': query, 'method': method}, ensure_ascii=False)
+    with _log_lock, open(QUERY_LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+
+
+def mine_frequent_queries(log_paths: Iterable[str], top_n: int = DEFAULT_TOP_QUERIES,
+                          min_count: int = DEFAULT_MIN_COUNT) -> List[str]:
+    """
+    Counts normalized queries in JSONL or plain-text logs and returns the most frequent ones.
+
+    Args:
+        log_paths: Query log files (missing files are skipped)
+        top_n: Maximum number of queries to keep
+        min_count: Ignore queries seen fewer times than this
+
+    Returns:
+        List of normalized queries, most frequent first
+    """
+    counts = Counter()
+    for path in log_paths:
+        if not path or not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                query = json.loads(line).get('query', '') if line.startswith('{') else line
+                query = normalize_query(query)
+                if query:
+                    counts[query] += 1
+    return [q for q, c in counts.most_common(top_n) if c >= min_count]
+
+
+def create_query_embeddings(log_paths: Iterable[str] = (), top_n: int = DEFAULT_TOP_QUERIES,
+                            min_count: int = DEFAULT_MIN_COUNT):
+    """
+    Encodes frequent logged queries and all recipe names into the lookup table.
+
+    Args:
+        log_paths: Query logs to mine (QUERY_LOG_FILE is always included)
+        top_n: Maximum number of logged queries to include
+        min_count: Minimum number of occurrences for a logged query
+    """
+    from .models import Recipe
+    from .encoder import get_encoder
+
+    print("Creating precomputed query embeddings...")
+    log_paths = list(log_paths) + ([QUERY_LOG_FILE] if QUERY_LOG_FILE else [])
+    queries = mine_frequent_queries(log_paths, top_n, min_count)
+    names = [normalize_query(name) for (name,) in Recipe.query.with_entities(Recipe.name).all() if name]
+
+    # Deduplicate by hash, keeping the first occurrence
+    unique = {}
+    for query in queries + names:
+        unique.setdefault(query_hash(query), query)
+    keys = np.array(sorted(unique), dtype=np.uint64)
+    texts = [unique[int(k)] for k in keys]
+
+    vectors = get_encoder().encode(texts).cpu().numpy().astype(np.float32)
+
+    # Write next to the live files and swap, so readers never see a half-written table
+    for name, array in ((QUERY_VECTORS_FILE, vectors), (QUERY_KEYS_FILE, keys)):
+        path = artifact_path(name)
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    global _table
+    _table = None
+    print(f"Query embeddings saved: {len(queries)} logged queries, {len(names)} recipe names, "
+          f"{len(keys)} unique entries.")
+
+
+def load_query_embeddings():
+    """Memory-maps the query table once per process; returns None if it was never built."""
+    global _table
+    if _table is None:
+        keys_file, vectors_file = artifact_path(QUERY_KEYS_FILE), artifact_path(QUERY_VECTORS_FILE)
+        if not (os.path.exists(keys_file) and os.path.exists(vectors_file)):
+            return None
+        _table = (np.load(keys_file, mmap_mode='r'), np.load(vectors_file, mmap_mode='r'))
+    return _table
+
+
+def _reset():
+    global _table
+    _table = None
+
+
+on_snapshot_change(_reset)
+
+
+def lookup_query_embedding(query: str) -> Optional[np.ndarray]:
+    """
+    Returns the precomputed normalized embedding of a query, or None on a miss.
+    """
+    table = load_query_embeddings()
+    if table is None:
+        return None
+    keys, vectors = table
+    key = np.uint64(query_hash(query))
+    pos = int(np.searchsorted(keys, key))
+    if pos < len(keys) and keys[pos] == key:
+        return np.array(vectors[pos])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the precomputed query embedding table')
+    parser.add_argument('--log', nargs='*', default=[], help='Query log files (JSONL or one query per line)')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_QUERIES)
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context(), new_generation():
+        create_query_embeddings(args.log, args.top, args.min_count)
+
+
+if __name__ == '__main__':
+    main()
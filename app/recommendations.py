@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from .search_preprocessing import load_embeddings
+from .neighbours import _normalize
+from .snapshots import on_snapshot_change
+
+MAX_CACHED_USERS = 10000
+
+_embedding_store = None
+_recommendation_cache = OrderedDict()
+
+
+def _load_store():
+    """Loads normalized recipe embeddings once per process."""
+    global _embedding_store
+    if _embedding_store is None:
+        recipe_ids, embeddings = load_embeddings()
+        ids = np.asarray(recipe_ids, dtype=np.int64)
+        id_to_row = {int(rid): row for row, rid in enumerate(ids)}
+        _embedding_store = (ids, id_to_row, _normalize(embeddings))
+    return _embedding_store
+
+
+def recommend_for_user(user_id: int, seed_ids: List[int], seen_ids: List[int],
+                       limit: int = 10) -> List[int]:
+    """
+    Recommends recipes close to the centroid of a user's liked/bookmarked recipes.
+
+    Results are cached per user until invalidate_recommendations() is called.
+
+    Args:
+        user_id: User to recommend for (cache key)
+        seed_ids: Recipe ids whose embeddings form the user profile
+        seen_ids: Recipe ids to exclude from the results
+        limit: Maximum number of recommendations
+
+    Returns:
+        List of recommended recipe ids, best first
+    """
+    cached = _recommendation_cache.get(user_id)
+    if cached is not None:
+        _recommendation_cache.move_to_end(user_id)
+        return cached[:limit]
+
+    ids, id_to_row, embeddings = _load_store()
+    rows = [id_to_row[rid] for rid in seed_ids if rid in id_to_row]
+    if not rows:
+        return []
+
+    centroid = embeddings[rows].mean(axis=0)
+    centroid /= np.linalg.norm(centroid) or 1.0
+    scores = embeddings @ centroid
+
+    seen_rows = [id_to_row[rid] for rid in seen_ids if rid in id_to_row]
+    scores[seen_rows] = -np.inf
+
+    k = min(limit, len(scores) - len(seen_rows))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    recommended = ids[top].tolist()
+
+    _recommendation_cache[user_id] = recommended
+    if len(_recommendation_cache) > MAX_CACHED_USERS:
+        _recommendation_cache.popitem(last=False)
+    return recommended
+
+
+def invalidate_recommendations(user_id: int):
+    """Drops cached recommendations for a user after a new interaction."""
+    _recommendation_cache.pop(user_id, None)
+
+
+def _reset():
+    """Drops the embeddings and every cached recommendation; a new snapshot may add or change recipes."""
+    global _embedding_store
+    _embedding_store = None
+    _recommendation_cache.clear()
+
+
+on_snapshot_change(_reset)
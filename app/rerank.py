@@ -0,0 +1,185 @@
+"""
+Optional cross-encoder reranking of first-stage search hits.
+
+The top RERANK_CANDIDATES hits of BM25 or embedding search are scored
+jointly with the query by a small cross-encoder, in batches, within a
+per-request time budget. Scores are cached per (query, recipe id), so
+repeated queries only pay for candidates they have not seen. If the budget
+runs out before every candidate is scored, the first-stage order is kept.
+
+The model is never loaded inside a request: it is loaded at startup with
+RERANK_PRELOAD=1, otherwise in the background on the first rerank request,
+and requests degrade to the first-stage order until it is ready.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .query_cache import normalize_query
+from .snapshots import on_snapshot_change
+
+logger = logging.getLogger(__name__)
+
+# Multilingual MiniLM trained on mMARCO; the recipes are in Russian
+RERANK_MODEL = os.environ.get('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+RERANK_CANDIDATES = int(os.environ.get('RERANK_CANDIDATES', 30))
+RERANK_BATCH_SIZE = int(os.environ.get('RERANK_BATCH_SIZE', 8))
+RERANK_BUDGET_MS = float(os.environ.get('RERANK_BUDGET_MS', 150))
+RERANK_CACHE_SIZE = int(os.environ.get('RERANK_CACHE_SIZE', 50000))
+# Characters of recipe text passed to the model; it truncates to 512 tokens anyway
+RERANK_TEXT_CHARS = 600
+# Load the cross-encoder at startup; rerank is opt-in per request, so off by default
+RERANK_PRELOAD = os.environ.get('RERANK_PRELOAD', '0') == '1'
+# Weight of the newest batch in the moving average of batch durations
+BATCH_EWMA_ALPHA = 0.2
+
+_model = None
+_model_lock = threading.Lock()
+_loader = None
+_loader_lock = threading.Lock()
+# Moving average of batch durations in ms, so the first batch of a request is budgeted too
+_batch_ms = 0.0
+_cache: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_reranker():
+    """Loads the cross-encoder once per process."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                from .encoder import configure_torch_threads
+
+                configure_torch_threads()
+                _model = CrossEncoder(RERANK_MODEL, device='cpu')
+                logger.info(f"Cross-encoder {RERANK_MODEL} loaded")
+    return _model
+
+
+def reranker_loaded() -> bool:
+    """Whether the cross-encoder is already loaded in this process."""
+    return _model is not None
+
+
+def load_reranker_in_background():
+    """Starts loading the cross-encoder in a daemon thread, unless it is loaded or loading."""
+    global _loader
+    # Not _model_lock: the loader holds it while the model loads
+    with _loader_lock:
+        if _model is not None or (_loader is not None and _loader.is_alive()):
+            return
+        _loader = threading.Thread(target=get_reranker, name='rerank-loader', daemon=True)
+        _loader.start()
+
+
+def recipe_passage(recipe) -> str:
+    """Text the cross-encoder sees for a recipe: name, ingredients, start of the instructions."""
+    parts = [recipe.name or '', recipe.ingredients or '', (recipe.text or '')[:RERANK_TEXT_CHARS]]
+    return '. '.join(p for p in parts if p)
+
+
+def _cached_scores(query: str, recipe_ids: Sequence[int]) -> Dict[int, float]:
+    scores = {}
+    with _cache_lock:
+        for recipe_id in recipe_ids:
+            score = _cache.get((query, recipe_id))
+            if score is not None:
+                _cache.move_to_end((query, recipe_id))
+                scores[recipe_id] = score
+    return scores
+
+
+def _store_scores(query: str, scores: Dict[int, float]):
+    with _cache_lock:
+        for recipe_id, score in scores.items():
+            _cache[(query, recipe_id)] = score
+        while len(_cache) > RERANK_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear_rerank_cache():
+    """Drops all cached scores, e.g. after the recipe texts changed."""
+    with _cache_lock:
+        _cache.clear()
+
+
+# A new snapshot may come with changed recipe texts
+on_snapshot_change(clear_rerank_cache)
+
+
+def rerank(query: str, recipes: List, budget_ms: float = RERANK_BUDGET_MS,
+           batch_size: int = RERANK_BATCH_SIZE) -> Tuple[List, Optional[List[float]], Dict]:
+    """
+    Reorders first-stage candidates by cross-encoder score.
+
+    A batch is only started if the time spent so far plus the expected
+    batch duration (the slowest batch of this request, or the moving average
+    of earlier requests before the first one) still fits into the budget.
+    Batches that did finish are cached even when the request degrades, so a
+    repeat of the query gets further. While the model is not loaded, only
+    cached scores are used and loading is started in the background.
+
+    Args:
+        query: Search query as typed
+        recipes: Candidate recipes in first-stage order
+        budget_ms: Time allowed for scoring, in milliseconds
+        batch_size: Query-passage pairs per model call
+
+    Returns:
+        (recipes, scores, info): recipes reordered by score with their scores,
+        or the input order and None if the budget ran out. info holds
+        candidates, cache_hits, scored, batches, degraded and latency_ms.
+    """
+    start = time.perf_counter()
+    key = normalize_query(query)
+    ids = [r.id for r in recipes]
+    scores = _cached_scores(key, ids)
+    info = {'candidates': len(recipes), 'cache_hits': len(scores), 'scored': 0,
+            'batches': 0, 'degraded': False}
+
+    global _batch_ms
+    pending = [r for r in recipes if r.id not in scores]
+    if pending and not reranker_loaded():
+        load_reranker_in_background()
+        info['degraded'] = True
+        info['latency_ms'] = (time.perf_counter() - start) * 1000
+        logger.info("Cross-encoder not loaded yet, keeping first-stage order")
+        return recipes, None, info
+
+    slowest = _batch_ms
+    for offset in range(0, len(pending), batch_size):
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed + slowest > budget_ms:
+            info['degraded'] = True
+            break
+        batch = pending[offset:offset + batch_size]
+        batch_start = time.perf_counter()
+        values = get_reranker().predict(
+            [(query, recipe_passage(r)) for r in batch], batch_size=len(batch), show_progress_bar=False
+        )
+        batch_ms = (time.perf_counter() - batch_start) * 1000
+        slowest = max(slowest, batch_ms)
+        if _batch_ms:
+            _batch_ms += BATCH_EWMA_ALPHA * (batch_ms - _batch_ms)
+        else:
+            _batch_ms = batch_ms
+        batch_scores = {r.id: float(v) for r, v in zip(batch, values)}
+        _store_scores(key, batch_scores)
+        scores.update(batch_scores)
+        info['scored'] += len(batch)
+        info['batches'] += 1
+
+    info['latency_ms'] = (time.perf_counter() - start) * 1000
+    if info['degraded']:
+        logger.info(f"Rerank budget of {budget_ms} ms exceeded after {info['scored']} of "
+                    f"{len(pending)} candidates, keeping first-stage order")
+        return recipes, None, info
+
+    # sorted() is stable, so equal scores keep their first-stage order
+    ranked = sorted(recipes, key=lambda r: -scores[r.id])
+    return ranked, [scores[r.id] for r in ranked], info
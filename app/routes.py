@@ -1,20 +1,39 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+import os
+from flask import Blueprint, Response, jsonify, render_template, request, redirect, url_for, session, flash
 from typing import List, Dict
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import text
 from app.models import User, Recipe, Interaction
+from .interactions import record_interaction
+from .leaderboard import top_users
+from .queries import fetch_recipes_by_ids
+from .metrics import SearchSpans, render_metrics
+from .encoder import encode_query, MODEL_NAME
+from .query_cache import log_query
+from .suggest import suggest
+from .spelling import correct_query
+from .snapshots import on_snapshot_change, refresh_snapshot
 from app import db
 from .search_preprocessing import load_whoosh_index, verify_whoosh_index, load_embeddings
+from .neighbours import get_similar_recipes
+from .multivector import EMBEDDING_SCORING, search_multivector
+from .recommendations import recommend_for_user, invalidate_recommendations
 from whoosh.qparser import MultifieldParser, OrGroup
 from whoosh.scoring import BM25F
 import numpy as np
 import torch
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
 import time
+from contextlib import nullcontext
 from dataclasses import dataclass
 from typing import Any, Optional
 
 
+# Simple search results per page; the ranked methods show the top 10 only
+SEARCH_PAGE_SIZE = int(os.environ.get('WEB_SEARCH_PAGE_SIZE', 30))
+# search_type values with their own metrics label; anything else is counted as 'unknown'
+SEARCH_TYPES = ('simple', 'bm25', 'embedding')
+
+
 @dataclass
 class SearchResult:
     """Class to store search results along with timing information."""
@@ -34,11 +53,11 @@ class Timer:
         self.end_time = None
     
     def __enter__(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         return self
     
     def __exit__(self, *args):
-        self.end_time = time.time()
+        self.end_time = time.perf_counter()
     
     @property
     def duration(self) -> float:
@@ -46,16 +65,30 @@ class Timer:
         return (self.end_time - self.start_time) * 1000  # Convert to milliseconds
 
 
+def load_search_data():
+    """(Re)loads the Whoosh index and embeddings of the active snapshot."""
+    global whoosh_index, recipe_ids, embeddings
+    whoosh_index = load_whoosh_index()
+    recipe_ids, embeddings = load_embeddings()
+    embeddings = torch.from_numpy(embeddings)
+    embeddings = util.normalize_embeddings(embeddings)
+
+
 verify_whoosh_index()
-whoosh_index = load_whoosh_index()
-recipe_ids, embeddings = load_embeddings()
-embeddings = torch.from_numpy(embeddings)
-embeddings = util.normalize_embeddings(embeddings)
+load_search_data()
+on_snapshot_change(load_search_data)
 
 main_bp = Blueprint('main', __name__)
 
 
-def search_with_bm25(query_text: str, whoosh_index, limit: int = 10) -> List[int]:
+@main_bp.before_app_request
+def refresh_search_snapshot():
+    """Picks up a newly published snapshot between requests."""
+    refresh_snapshot()
+
+
+def search_with_bm25(query_text: str, whoosh_index, limit: int = 10,
+                     spans: Optional[SearchSpans] = None) -> List[int]:
     """
     Performs BM25 search using Whoosh index.
     
@@ -63,6 +96,7 @@ def search_with_bm25(query_text: str, whoosh_index, limit: int = 10) -> List[int
         query_text: The search query string
         whoosh_index: The Whoosh index object
         limit: Maximum number of results to return (default: 10)
+        spans: Optional stage timer for the parse/score stages
     
     Returns:
         List of recipe IDs matching the search criteria
@@ -72,6 +106,8 @@ def search_with_bm25(query_text: str, whoosh_index, limit: int = 10) -> List[int
     if not query_text:
         return []
 
+    stage = spans.stage if spans else (lambda name: nullcontext())
+
     # Create a searcher with BM25F scoring
     with whoosh_index.searcher(weighting=BM25F(B=0.75, K1=1.5)) as searcher:
         # Create parser with OR group to match any of the terms
@@ -83,13 +119,15 @@ def search_with_bm25(query_text: str, whoosh_index, limit: int = 10) -> List[int
         
         try:
             # Parse the query
-            parsed_query = parser.parse(query_text)
+            with stage('parse'):
+                parsed_query = parser.parse(query_text)
             
             # Perform the search
-            results = searcher.search(parsed_query, limit=limit)
+            with stage('score'):
+                results = searcher.search(parsed_query, limit=limit)
             
-            # Get recipe IDs and scores
-            recipe_ids = [(int(hit['id']), hit.score) for hit in results]
+                # Get recipe IDs and scores
+                recipe_ids = [(int(hit['id']), hit.score) for hit in results]
             
             # Sort by score in descending order
             recipe_ids.sort(key=lambda x: x[1], reverse=True)
@@ -168,12 +206,6 @@ def recipes():
 @main_bp.route('/recipe/<int:recipe_id>', methods=['GET', 'POST'])
 def recipe(recipe_id):
     recipe = Recipe.query.get_or_404(recipe_id)
-
-    # Ensure non-null values for counts
-    recipe.likes = max(recipe.likes or 0, 0)
-    recipe.dislikes = max(recipe.dislikes or 0, 0)
-    recipe.bookmarks = max(recipe.bookmarks or 0, 0)
-
     user_id = session.get('user_id')
 
     if request.method == 'POST':
@@ -181,52 +213,29 @@ def recipe(recipe_id):
             flash('You must be logged in to interact with recipes.', 'danger')
             return redirect(url_for('main.login'))
 
-        interaction = Interaction.query.filter_by(user_id=user_id, recipe_id=recipe_id).first()
-        if not interaction:
-            interaction = Interaction(user_id=user_id, recipe_id=recipe_id)
-            db.session.add(interaction)
-
-        action = request.form['action']
-
-        if action == 'like':
-            if not interaction.liked:  # If not liked
-                recipe.likes += 1
-                if interaction.liked is False:  # If switching from dislike
-                    recipe.dislikes = max(recipe.dislikes - 1, 0)
-                interaction.liked = True
-            else:  # Undo like
-                recipe.likes = max(recipe.likes - 1, 0)
-                interaction.liked = None
-
-        elif action == 'dislike':
-            if interaction.liked is not False:  # If not disliked
-                recipe.dislikes += 1
-                if interaction.liked:  # If switching from like
-                    recipe.likes = max(recipe.likes - 1, 0)
-                interaction.liked = False
-            else:  # Undo dislike
-                recipe.dislikes = max(recipe.dislikes - 1, 0)
-                interaction.liked = None
-
-        elif action == 'bookmark':
-            if not interaction.bookmarked:  # Bookmark the recipe
-                recipe.bookmarks += 1
-                interaction.bookmarked = True
-            else:  # Undo bookmark
-                recipe.bookmarks = max(recipe.bookmarks - 1, 0)
-                interaction.bookmarked = False
-
-        db.session.commit()
+        record_interaction(user_id, recipe_id, request.form['action'])
+        invalidate_recommendations(user_id)
+        # Counters were changed in SQL, reload them
+        db.session.refresh(recipe)
         flash('Your interaction has been recorded.', 'success')
 
+    # Ensure non-null values for counts
+    recipe.likes = max(recipe.likes or 0, 0)
+    recipe.dislikes = max(recipe.dislikes or 0, 0)
+    recipe.bookmarks = max(recipe.bookmarks or 0, 0)
+
     user_interaction = None
     if user_id:
         user_interaction = Interaction.query.filter_by(user_id=user_id, recipe_id=recipe_id).first()
 
+    similar_ids = [rid for rid, _ in get_similar_recipes(recipe_id, limit=5)]
+    similar_recipes = fetch_recipes_by_ids(db.session, similar_ids)
+
     return render_template(
         'recipe.html',
         recipe=recipe,
         user_interaction=user_interaction,
+        similar_recipes=similar_recipes,
         title=recipe.name
     )
 
@@ -240,8 +249,18 @@ def profile():
 
     user = User.query.get_or_404(user_id)
     interactions = Interaction.query.filter_by(user_id=user_id).all()
-    liked_recipes = [Recipe.query.get(interaction.recipe_id) for interaction in interactions if interaction.liked]
-    bookmarked_recipes = [Recipe.query.get(interaction.recipe_id) for interaction in interactions if interaction.bookmarked]
+    liked_ids = [interaction.recipe_id for interaction in interactions if interaction.liked]
+    bookmarked_ids = [interaction.recipe_id for interaction in interactions if interaction.bookmarked]
+    seen_ids = [interaction.recipe_id for interaction in interactions]
+
+    recommended_ids = recommend_for_user(user_id, liked_ids + bookmarked_ids, seen_ids)
+
+    # Load every recipe the page needs in one query instead of one per interaction
+    needed_ids = list(set(liked_ids) | set(bookmarked_ids) | set(recommended_ids))
+    id_to_recipe = {r.id: r for r in fetch_recipes_by_ids(db.session, needed_ids)}
+    liked_recipes = [id_to_recipe[rid] for rid in liked_ids if rid in id_to_recipe]
+    bookmarked_recipes = [id_to_recipe[rid] for rid in bookmarked_ids if rid in id_to_recipe]
+    recommended_recipes = [id_to_recipe[rid] for rid in recommended_ids if rid in id_to_recipe]
 
     if request.method == 'POST':
         if 'update' in request.form:
@@ -265,6 +284,7 @@ def profile():
         elif 'delete' in request.form:
             db.session.delete(user)
             db.session.commit()
+            invalidate_recommendations(user_id)
             session.clear()
             flash('Account deleted successfully.', 'success')
             return redirect(url_for('main.home'))
@@ -274,6 +294,7 @@ def profile():
         user=user,
         liked_recipes=liked_recipes,
         bookmarked_recipes=bookmarked_recipes,
+        recommended_recipes=recommended_recipes,
         title="Your Profile"
     )
 
@@ -287,27 +308,17 @@ def logout():
 
 @main_bp.route('/rank', methods=['GET'])
 def rank_users():
-    query = text("""
-        SELECT 
-            users.username AS username,
-            COUNT(interactions.id) AS total_interactions
-        FROM 
-            users
-        INNER JOIN 
-            interactions 
-        ON 
-            users.id = interactions.user_id
-        GROUP BY 
-            users.id
-        ORDER BY 
-            total_interactions DESC
-        LIMIT 10;
-    """)
-    result = db.session.execute(query).fetchall()
-    users = [{"username": row.username, "total_interactions": row.total_interactions} for row in result]
+    users = top_users(limit=10)
     return render_template('rank.html', users=users, enumerate=enumerate)
 
 
+@main_bp.route('/suggest')
+def suggestions():
+    prefix = request.args.get('prefix', '')[:100]
+    limit = min(request.args.get('limit', 10, type=int), 20)
+    return jsonify(prefix=prefix, suggestions=suggest(prefix, limit))
+
+
 @main_bp.route('/search', methods=['GET', 'POST'])
 def search():
     """
@@ -315,29 +326,38 @@ def search():
     - Simple text search (default)
     - BM25-based search
     - Embedding-based semantic search
+
+    Simple search results are paginated; the page links use GET with the
+    same parameters as the form.
     """
     recipes = []
-    search_type = request.form.get('search_type', 'simple')
-    query = request.form.get('query', '').strip()
+    search_type = request.values.get('search_type', 'simple')
+    query = request.values.get('query', '').strip()
+    page = request.values.get('page', 1, type=int)
+    debug = request.values.get('debug') == 'true'
+    spans = SearchSpans('web', search_type if search_type in SEARCH_TYPES else 'unknown', debug=debug)
     search_result = None
+    pagination = None
     search_performed = False
-    if request.method == 'POST' and query:
+    if query:
         search_performed = True
+        log_query(query, search_type)
         try:
             if search_type == 'simple':
                 # Simple database search
-                with Timer('Simple Search') as timer:
-                        recipes = Recipe.query.filter(
+                with Timer('Simple Search') as timer, spans.stage('hydrate'):
+                        pagination = Recipe.query.filter(
                             (Recipe.name.like(f"%{query}%")) |
                             (Recipe.type.like(f"%{query}%")) |
                             (Recipe.kitchen.like(f"%{query}%")) |
                             (Recipe.recipe_text.like(f"%{query}%"))
-                        ).all()
+                        ).order_by(Recipe.id).paginate(page=page, per_page=SEARCH_PAGE_SIZE, error_out=False)
+                        recipes = pagination.items
 
                 search_result = SearchResult(
                     recipes=recipes,
                     execution_time=timer.duration,
-                    total_results=len(recipes),
+                    total_results=pagination.total,
                     search_type="Simple Database Search",
                     details={"type": "SQL LIKE query"}
                 )
@@ -345,12 +365,12 @@ def search():
             elif search_type == 'bm25':
                 # Use the improved BM25 search function
                 with Timer("BM25 Search") as timer:
-                    recipe_ids = search_with_bm25(query, whoosh_index)
-                    if recipe_ids:
+                    with spans.stage('spell'):
+                        corrected_query = correct_query(query)
+                    recipe_ids = search_with_bm25(corrected_query or query, whoosh_index, spans=spans)
                     # Fetch recipes while maintaining search order
-                        id_to_pos = {id: pos for pos, id in enumerate(recipe_ids)}
-                        recipes = Recipe.query.filter(Recipe.id.in_(recipe_ids)).all()
-                        recipes.sort(key=lambda x: id_to_pos[x.id])
+                    with spans.stage('hydrate'):
+                        recipes = fetch_recipes_by_ids(db.session, recipe_ids)
                 
                 search_result = SearchResult(
                     recipes=recipes,
@@ -359,23 +379,35 @@ def search():
                     search_type="BM25 Search",
                     details={"type": "Whoosh BM25F", "indexed_fields": ["name", "ingredients", "text"]}
                 )
+                if corrected_query:
+                    search_result.details["corrected_query"] = corrected_query
+                    flash(f'Showing results for "{corrected_query}".', 'info')
 
             elif search_type == 'embedding':
-                # Load embeddings and ids first
                 with Timer("Embedding Search") as timer:
-                    embedding_data = load_embeddings()  # This returns recipe_ids and embeddings
-                    recipe_ids, stored_embeddings = embedding_data
-                    model = SentenceTransformer('all-MiniLM-L6-v2')
-                    query_embedding = model.encode(query, convert_to_tensor=True)
-                    query_embedding = util.normalize_embeddings(query_embedding.unsqueeze(0))    
-                    similarities = util.pytorch_cos_sim(query_embedding, stored_embeddings)[0]
-                    top_k = 10
-                    top_indices = torch.topk(similarities, min(top_k, len(similarities)))[1]
-        
-                    top_recipe_ids = [recipe_ids[idx] for idx in top_indices.tolist()]
-                    if top_recipe_ids:
-                        recipes = Recipe.query.filter(Recipe.id.in_(top_recipe_ids)).all()
-                        recipes.sort(key=lambda x: top_recipe_ids.index(x.id))
+                    if EMBEDDING_SCORING != 'single':
+                        # Max over the per-field and text-chunk vectors of each recipe
+                        with spans.stage('encode'):
+                            query_embedding = encode_query(query)
+                        with spans.stage('score'):
+                            hits = search_multivector(query_embedding.cpu().numpy()[0], 10, EMBEDDING_SCORING)
+                        top_recipe_ids = [rid for rid, _ in hits]
+                    else:
+                        # Load embeddings and ids first
+                        with spans.stage('load'):
+                            embedding_data = load_embeddings()  # This returns recipe_ids and embeddings
+                            recipe_ids, stored_embeddings = embedding_data
+                        with spans.stage('encode'):
+                            query_embedding = encode_query(query)
+                        with spans.stage('score'), torch.inference_mode():
+                            similarities = util.pytorch_cos_sim(query_embedding, stored_embeddings)[0]
+                        with spans.stage('topk'):
+                            top_k = 10
+                            top_indices = torch.topk(similarities, min(top_k, len(similarities)))[1]
+            
+                            top_recipe_ids = [recipe_ids[idx] for idx in top_indices.tolist()]
+                    with spans.stage('hydrate'):
+                        recipes = fetch_recipes_by_ids(db.session, top_recipe_ids)
 
                 search_result = SearchResult(
                     recipes=recipes,
@@ -384,11 +416,17 @@ def search():
                     search_type="Semantic Search",
                     details={
                         "type": "Sentence Transformers",
-                        "model": "all-MiniLM-L6-v2",
-                        "similarity": "Cosine"
+                        "model": MODEL_NAME,
+                        "similarity": "Cosine",
+                        "scoring": EMBEDDING_SCORING
                     }
                 )
             
+            if debug and search_result:
+                search_result.details["timings_ms"] = {
+                    stage: round(ms, 2) for stage, ms in spans.timings.items()
+                }
+
             if not recipes:
                 flash('No recipes found matching your search criteria.', 'info')
 
@@ -396,6 +434,7 @@ def search():
         except Exception as e:
             flash(f'An error occurred during search: {str(e)}', 'danger')
             recipes = []
+            pagination = None
             search_result = SearchResult(
                 recipes=[],
                 execution_time=0,
@@ -404,11 +443,22 @@ def search():
                 details={"error": str(e)}
             )
 
-    return render_template(
-        'search.html',
-        recipes=recipes,
-        search_result=search_result,
-        search_type=search_type,
-        query=query,
-        title="Search Recipes"
-    )
\ No newline at end of file
+    with spans.stage('render'):
+        page = render_template(
+            'search.html',
+            recipes=recipes,
+            search_result=search_result,
+            pagination=pagination,
+            search_type=search_type,
+            query=query,
+            title="Search Recipes"
+        )
+    if search_performed:
+        spans.finish()
+    return page
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """Search latency histograms in the Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
\ No newline at end of file
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class SearchMethod(str, Enum):
     """Available search methods."""
@@ -8,6 +8,12 @@ class SearchMethod(str, Enum):
     EMBEDDING = "embedding"
     SIMPLE = "simple"
 
+class EmbeddingScoring(str, Enum):
+    """How embedding search scores a recipe."""
+    SINGLE = "single"
+    MAX = "max"
+    WEIGHTED = "weighted"
+
 class CorpusInfo(BaseModel):
     """Information about the recipe corpus."""
     total_recipes: int = Field(1806, description="Total number of recipes in the corpus")
@@ -35,10 +41,46 @@ class SearchResult(BaseModel):
     recipe: Recipe
     score: Optional[float] = None
 
+class RerankInfo(BaseModel):
+    """What the cross-encoder rerank stage did for a request."""
+    candidates: int = Field(..., description="First-stage hits considered")
+    cache_hits: int = Field(..., description="Candidates whose score was cached")
+    scored: int = Field(..., description="Candidates scored by the model in this request")
+    batches: int
+    degraded: bool = Field(..., description="Budget exceeded, first-stage order kept")
+    latency_ms: float = Field(..., description="Time added by the rerank stage")
+
 class SearchResponse(BaseModel):
     """Search response model."""
     query: str
     method: SearchMethod
     execution_time_ms: float
-    total_results: int
-    results: List[SearchResult]
\ No newline at end of file
+    total_results: int = Field(..., description="Results in this page")
+    offset: int = Field(0, description="Rank of the first result in this page")
+    next_offset: Optional[int] = Field(
+        None, description="Offset of the next page, null on the last one"
+    )
+    results: List[SearchResult]
+    fallback: Optional[str] = Field(
+        None, description="Cheaper path taken to meet deadline_ms: bm25 or cached_embedding"
+    )
+    corrected_query: Optional[str] = Field(
+        None, description="Spelling-corrected query actually searched (BM25 only)"
+    )
+    rerank: Optional[RerankInfo] = Field(
+        None, description="Rerank stage report (only with rerank=true)"
+    )
+    timings: Optional[Dict[str, float]] = Field(
+        None, description="Per-stage durations in milliseconds (only with debug=true)"
+    )
+
+class Suggestion(BaseModel):
+    """Typeahead suggestion."""
+    text: str
+    kind: str = Field(..., description="'recipe' or 'ingredient'")
+    weight: int = Field(..., description="Popularity used for ranking")
+
+class SuggestResponse(BaseModel):
+    """Typeahead response model."""
+    prefix: str
+    suggestions: List[Suggestion]
\ No newline at end of file
@@ -1,45 +1,97 @@
 import os
+import ast
 import pickle
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from whoosh.index import create_in, open_dir
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.qparser import MultifieldParser
 import torch
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from .models import Recipe
 from .extensions import db
 
-PREPROCESSED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocessed')
-WHOOSH_INDEX_DIR = os.path.join(PREPROCESSED_DIR, 'whoosh_index')
-EMBEDDINGS_FILE = os.path.join(PREPROCESSED_DIR, 'embeddings.pkl')
+from .snapshots import PREPROCESSED_DIR, artifact_path
+
+# Paths inside a snapshot generation, see artifact_path()
+WHOOSH_INDEX_DIR = 'whoosh_index'
+EMBEDDINGS_FILE = 'embeddings.pkl'
+
+def parse_ingredients(value: Optional[str]) -> List[str]:
+    """
+    Parses the ingredients column, stored as a Python list literal
+    (e.g. "['Спагетти', 'Чеснок']"), into a list of ingredient names.
+    """
+    if not value:
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [part.strip(" '\"[]") for part in value.split(',') if part.strip(" '\"[]")]
+    if isinstance(parsed, (list, tuple)):
+        return [str(item).strip() for item in parsed if str(item).strip()]
+    return [str(parsed).strip()]
+
 
 def ensure_preprocessed_data():
     """
-    Ensures that preprocessed data exists. If not, preprocess and save.
+    Ensures that a complete, consistent snapshot of the preprocessed data exists.
+
+    Missing artifacts are built into a new snapshot generation, which is
+    published only after it passes the consistency check. The check and the
+    build run under the build lock, so of several processes starting at once
+    only the first builds and the others pick up its generation.
     """
+    from .snapshots import active_generation, build_lock, new_generation, refresh_snapshot, verify_snapshot
+    from .spelling import SPELLING_FILE, create_spelling_index
+    from .suggest import SUGGEST_FILE, create_suggest_index
+    from .query_cache import QUERY_KEYS_FILE, create_query_embeddings
+    from .neighbours import NEIGHBOURS_FILE, create_neighbours
+    from .multivector import MULTIVECTOR_FILE, create_multivector
+
+    # In build order: the spelling index needs the Whoosh index, neighbours need embeddings
+    artifacts = [
+        ("Whoosh index", WHOOSH_INDEX_DIR, create_whoosh_index),
+        ("Spelling index", SPELLING_FILE, create_spelling_index),
+        ("Embeddings", EMBEDDINGS_FILE, create_embeddings),
+        ("Multi-vector embeddings", MULTIVECTOR_FILE, create_multivector),
+        ("Suggest index", SUGGEST_FILE, create_suggest_index),
+        ("Query embeddings", QUERY_KEYS_FILE, create_query_embeddings),
+        ("Neighbours", NEIGHBOURS_FILE, create_neighbours),
+    ]
+
     if not os.path.exists(PREPROCESSED_DIR):
         os.makedirs(PREPROCESSED_DIR)
         print(f"Created preprocessed directory at {PREPROCESSED_DIR}")
 
-    # Check for Whoosh index
-    if not os.path.exists(WHOOSH_INDEX_DIR):
-        create_whoosh_index()
-    else:
-        print("Whoosh index already exists. Skipping index creation.")
+    with build_lock():
+        # Another process may have published while this one waited for the lock
+        refresh_snapshot(force=True)
+        if active_generation() is None:
+            missing = [label for label, _, _ in artifacts]
+        else:
+            missing = [label for label, name, _ in artifacts if not os.path.exists(artifact_path(name))]
 
-    # Check for embeddings
-    if not os.path.exists(EMBEDDINGS_FILE):
-        create_embeddings()
-    else:
-        print("Embeddings already exist. Skipping embeddings creation.")
+        if missing:
+            print(f"Missing preprocessed data ({', '.join(missing)}), building a new snapshot...")
+            with new_generation():
+                for label, name, create in artifacts:
+                    if os.path.exists(artifact_path(name)):
+                        print(f"{label} already exists. Skipping.")
+                    else:
+                        create()
+        else:
+            print("Preprocessed data already exists. Skipping preprocessing.")
 
-def create_whoosh_index():
-    """Creates a Whoosh index from preprocessed recipe data."""
-    print("Starting Whoosh index creation process...")
-   
+    # Fail fast instead of serving an index and embeddings that disagree
+    manifest = verify_snapshot()
+    print(f"Serving snapshot {manifest['generation']} ({manifest['recipe_count']} recipes)")
+
+def make_text_preprocessor():
+    """
+    Returns the function used to normalize recipe fields before indexing.
+    """
    # Import preprocessing tools
     import nltk
     from nltk.tokenize import word_tokenize
@@ -75,6 +127,29 @@ def create_whoosh_index():
         # Rejoin text
         return " ".join(tokens)
 
+    return preprocess_text
+
+
+def recipe_document(recipe, preprocess_text) -> Dict[str, str]:
+    """Whoosh document for a recipe."""
+    return {
+        'id': str(recipe.id),
+        'name': preprocess_text(recipe.name),
+        'ingredients': preprocess_text(recipe.ingredients),
+        'text': preprocess_text(recipe.text)
+    }
+
+
+def recipe_embedding_text(recipe) -> str:
+    """Text a recipe is embedded from."""
+    return f"{recipe.name} {recipe.ingredients} {recipe.text}"
+
+
+def create_whoosh_index():
+    """Creates a Whoosh index from preprocessed recipe data."""
+    print("Starting Whoosh index creation process...")
+    preprocess_text = make_text_preprocessor()
+
     schema = Schema(
         id=ID(stored=True, unique=True),
         name=TEXT(stored=True, field_boost=2.0),
@@ -82,10 +157,11 @@ def create_whoosh_index():
         text=TEXT(stored=True)
     )
 
-    if not os.path.exists(WHOOSH_INDEX_DIR):
-        os.makedirs(WHOOSH_INDEX_DIR)
+    index_dir = artifact_path(WHOOSH_INDEX_DIR)
+    if not os.path.exists(index_dir):
+        os.makedirs(index_dir)
 
-    ix = create_in(WHOOSH_INDEX_DIR, schema)
+    ix = create_in(index_dir, schema)
     writer = ix.writer()
 
     try:
@@ -98,12 +174,7 @@ def create_whoosh_index():
             return
 
         for i, recipe in enumerate(recipes, 1):
-            recipe_data = {
-                'id': str(recipe.id),
-                'name': preprocess_text(recipe.name),
-                'ingredients': preprocess_text(recipe.ingredients),
-                'text': preprocess_text(recipe.text)
-            }
+            recipe_data = recipe_document(recipe, preprocess_text)
 
             if i <= 3:
                 print(f"\nIndexing recipe {i}/{total_recipes}:")
@@ -120,6 +191,10 @@ def create_whoosh_index():
         with ix.searcher() as searcher:
             doc_count = searcher.doc_count()
             print(f"\nIndex creation completed: {doc_count} documents indexed")
+
+        # The spelling index mirrors the vocabulary, so rebuild it with the index
+        from .spelling import create_spelling_index
+        create_spelling_index(ix)
            
         return ix
 
@@ -132,11 +207,11 @@ def verify_whoosh_index():
     """
     Verifies the content of the Whoosh index and prints statistics.
     """
-    if not os.path.exists(WHOOSH_INDEX_DIR):
+    if not os.path.exists(artifact_path(WHOOSH_INDEX_DIR)):
         print("Index directory does not exist!")
         return
         
-    ix = open_dir(WHOOSH_INDEX_DIR)
+    ix = open_dir(artifact_path(WHOOSH_INDEX_DIR))
     with ix.searcher() as searcher:
         print(f"Number of documents in index: {searcher.doc_count()}")
         
@@ -161,40 +236,109 @@ def create_embeddings():
     recipes = Recipe.query.all()
 
     # Concatenate relevant fields
-    texts = [f"{recipe.name} {recipe.ingredients} {recipe.text}" for recipe in recipes]
+    texts = [recipe_embedding_text(recipe) for recipe in recipes]
     recipe_ids = [recipe.id for recipe in recipes]
 
     # Load the model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    from .encoder import get_encoder
+    encoder = get_encoder()
 
-    # Generate embeddings and convert to numpy for storage
-    embeddings = model.encode(texts, convert_to_tensor=True)
-    embeddings = embeddings.detach().cpu().numpy()
+    # Generate normalized embeddings and convert to numpy for storage
+    embeddings = encoder.encode(texts)
+    embeddings = embeddings.cpu().numpy()
 
-    # Save embeddings and recipe_ids
-    with open(EMBEDDINGS_FILE, 'wb') as f:
+    # Save embeddings and recipe_ids; replaced, not rewritten, since the file may be hard-linked
+    tmp_file = artifact_path(EMBEDDINGS_FILE) + '.tmp'
+    with open(tmp_file, 'wb') as f:
         pickle.dump({
             'recipe_ids': recipe_ids, 
             'embeddings': embeddings
         }, f)
+    os.replace(tmp_file, artifact_path(EMBEDDINGS_FILE))
 
     print("Embeddings created and saved successfully.")
 
+def update_whoosh_index(recipe_ids: List[int]):
+    """
+    Adds or replaces the given recipes in the existing Whoosh index.
+
+    Args:
+        recipe_ids: Ids of recipes that were inserted or changed
+    """
+    from .queries import fetch_recipes_by_ids
+
+    ix = load_whoosh_index()
+    preprocess_text = make_text_preprocessor()
+    writer = ix.writer()
+    try:
+        for recipe in fetch_recipes_by_ids(db.session, recipe_ids):
+            # id is a unique field, so this replaces any previous version
+            writer.update_document(**recipe_document(recipe, preprocess_text))
+        writer.commit()
+    except Exception:
+        writer.cancel()
+        raise
+    print(f"Whoosh index updated with {len(recipe_ids)} recipes.")
+    return ix
+
+
+def update_embeddings(recipe_ids: List[int]):
+    """
+    Encodes the given recipes and merges them into the embeddings file.
+
+    Changed recipes replace their row, new ones are appended.
+
+    Args:
+        recipe_ids: Ids of recipes that were inserted or changed
+    """
+    from .queries import fetch_recipes_by_ids
+    from .encoder import get_encoder
+
+    stored_ids, embeddings = load_embeddings()
+    stored_ids = list(stored_ids)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    recipes = fetch_recipes_by_ids(db.session, recipe_ids)
+    vectors = get_encoder().encode([recipe_embedding_text(r) for r in recipes]).cpu().numpy()
+
+    id_to_row = {rid: row for row, rid in enumerate(stored_ids)}
+    appended = []
+    for recipe, vector in zip(recipes, vectors):
+        row = id_to_row.get(recipe.id)
+        if row is None:
+            stored_ids.append(recipe.id)
+            appended.append(vector)
+        else:
+            embeddings[row] = vector
+    if appended:
+        embeddings = np.vstack([embeddings, np.asarray(appended, dtype=np.float32)])
+
+    tmp_file = artifact_path(EMBEDDINGS_FILE) + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump({
+            'recipe_ids': stored_ids,
+            'embeddings': embeddings
+        }, f)
+    os.replace(tmp_file, artifact_path(EMBEDDINGS_FILE))
+    print(f"Embeddings updated: {len(recipes) - len(appended)} replaced, {len(appended)} added.")
+
 def load_whoosh_index():
     """
     Loads the Whoosh index.
     """
-    if not os.path.exists(WHOOSH_INDEX_DIR):
+    index_dir = artifact_path(WHOOSH_INDEX_DIR)
+    if not os.path.exists(index_dir):
         raise FileNotFoundError("Whoosh index directory does not exist.")
-    ix = open_dir(WHOOSH_INDEX_DIR)
+    ix = open_dir(index_dir)
     return ix
 
 def load_embeddings():
     """
     Loads the sentence-transformer embeddings.
     """
-    if not os.path.exists(EMBEDDINGS_FILE):
+    embeddings_file = artifact_path(EMBEDDINGS_FILE)
+    if not os.path.exists(embeddings_file):
         raise FileNotFoundError("Embeddings file does not exist.")
-    with open(EMBEDDINGS_FILE, 'rb') as f:
+    with open(embeddings_file, 'rb') as f:
         data = pickle.load(f)
     return data['recipe_ids'], data['embeddings']
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Fast JSON encoding of search and listing responses.
+
+The static part of a recipe (id, name, type, kitchen, ingredients, text)
+is encoded once and cached as a JSON fragment keyed by id; only the
+like/dislike/bookmark counters, which change with every interaction, are
+appended per response. Fragments are dropped when a new snapshot is
+published, since an ingest may have changed recipe texts. Responses are
+assembled from the fragments as bytes, without building Pydantic models,
+and can be produced chunk by chunk for streaming.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .snapshots import on_snapshot_change
+
+try:
+    import orjson
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value)
+except ImportError:
+    import json
+
+    def dumps(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 20000))
+# Results per chunk when a response is streamed
+STREAM_CHUNK_RESULTS = int(os.environ.get('STREAM_CHUNK_RESULTS', 20))
+
+_fragments: "OrderedDict[int, bytes]" = OrderedDict()
+_fragments_lock = threading.Lock()
+
+
+def _static_fragment(recipe) -> bytes:
+    """JSON object of the recipe without its counters and the closing brace."""
+    with _fragments_lock:
+        fragment = _fragments.get(recipe.id)
+        if fragment is not None:
+            _fragments.move_to_end(recipe.id)
+            return fragment
+
+    fragment = dumps({
+        'id': recipe.id,
+        'name': recipe.name,
+        'type': recipe.type,
+        'kitchen': recipe.kitchen,
+        'ingredients': recipe.ingredients,
+        'text': recipe.text,
+    })[:-1]
+    with _fragments_lock:
+        _fragments[recipe.id] = fragment
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return fragment
+
+
+def clear_fragments():
+    """Drops all cached recipe fragments."""
+    with _fragments_lock:
+        _fragments.clear()
+
+
+on_snapshot_change(clear_fragments)
+
+
+def recipe_json(recipe) -> bytes:
+    """Recipe as a JSON object, matching schemas.Recipe."""
+    return b'%s,"likes":%d,"dislikes":%d,"bookmarks":%d}' % (
+        _static_fragment(recipe), recipe.likes or 0, recipe.dislikes or 0, recipe.bookmarks or 0
+    )
+
+
+def result_json(recipe, score: Optional[float] = None) -> bytes:
+    """Search hit as a JSON object, matching schemas.SearchResult."""
+    return b'{"recipe":%s,"score":%s}' % (recipe_json(recipe), dumps(score))
+
+
+def iter_results(recipes: List, id_to_score: Dict[int, float],
+                 chunk_results: int = STREAM_CHUNK_RESULTS) -> Iterator[bytes]:
+    """Comma-separated search hits, chunk_results per yielded chunk."""
+    for start in range(0, len(recipes), chunk_results):
+        chunk = b','.join(result_json(r, id_to_score.get(r.id)) for r in recipes[start:start + chunk_results])
+        yield chunk if start == 0 else b',' + chunk
+
+
+def iter_result_list(recipes: List, id_to_score: Dict[int, float]) -> Iterator[bytes]:
+    """JSON array of search hits, matching List[schemas.SearchResult]."""
+    yield b'['
+    yield from iter_results(recipes, id_to_score)
+    yield b']'
+
+
+def iter_search_response(meta: Dict, results: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    JSON search response, matching schemas.SearchResponse.
+
+    The metadata goes first, so a streaming client can read the totals and
+    the pagination fields before the results arrive.
+
+    Args:
+        meta: Every SearchResponse field except results, already JSON-compatible
+        results: Chunks from iter_results(), possibly still unencoded
+    """
+    yield dumps(meta)[:-1] + b',"results":['
+    yield from results
+    yield b']}'
@@ -0,0 +1,456 @@
+"""
+Sharded search: the corpus split by recipe id over several worker processes.
+
+Shard i holds the recipes with id % N == i: its own Whoosh index and its
+own segment of the embedding matrix, both cut from the full preprocessed
+artifacts by create_shards(). Each shard is served by a worker process
+listening on a multiprocessing.connection address; ShardCoordinator fans a
+query out to every shard in parallel and merges the per-shard top-k.
+
+BM25 scores are only comparable across shards if they use the same idf and
+average field lengths, so BM25 is a two-round exchange: every shard first
+reports its document count, field lengths and the document frequencies of
+the query terms, and the summed global statistics are sent back with the
+search itself. Cosine similarities need no exchange.
+
+Shards are cut from one snapshot generation, which their manifest records.
+The coordinator compares it with the generation the API serves and refuses
+to search stale shards, so after an ingest or rollback the shards have to
+be rebuilt and the workers restarted.
+
+    python -m app.shards build --shards 4
+    python -m app.shards launch --shards 4   # or one `serve` per shard
+"""
+import os
+import sys
+import math
+import time
+import queue
+import json
+import heapq
+import secrets
+import shutil
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .search_preprocessing import PREPROCESSED_DIR
+from .snapshots import active_generation, current_generation, on_snapshot_change
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = os.path.join(PREPROCESSED_DIR, 'shards')
+SHARD_FIELDS = ["name", "ingredients", "text"]
+# Comma-separated worker addresses (host:port or unix socket paths); empty means unsharded
+SHARD_ADDRESSES = [a for a in os.environ.get('SHARD_ADDRESSES', '').split(',') if a]
+# Shared secret of coordinator and workers; required for TCP addresses
+SHARD_AUTHKEY = os.environ.get('SHARD_AUTHKEY', '').encode()
+# Unix sockets are guarded by file permissions, so they may fall back to a fixed key
+LOCAL_AUTHKEY = b'recipe-shards'
+SHARD_TIMEOUT_S = float(os.environ.get('SHARD_TIMEOUT_S', 5))
+SHARD_BASE_PORT = 9100
+SHARD_MANIFEST = 'MANIFEST.json'
+
+
+class ShardError(RuntimeError):
+    """A shard worker failed or did not answer in time."""
+
+
+def shard_of(recipe_id: int, n_shards: int) -> int:
+    return recipe_id % n_shards
+
+
+def shard_path(shard: int, n_shards: int) -> str:
+    return os.path.join(SHARD_DIR, f"{n_shards}", f"shard_{shard}")
+
+
+def read_shard_manifest(n_shards: int) -> Dict:
+    """Manifest of the n_shards split; empty for shards built before manifests existed."""
+    try:
+        with open(os.path.join(SHARD_DIR, f"{n_shards}", SHARD_MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_address(address: str):
+    """'host:port' becomes a TCP address, anything else a unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+def shard_authkey(address) -> bytes:
+    """
+    Authentication key for a connection to or from a shard worker.
+
+    Raises:
+        ShardError: The address is TCP and SHARD_AUTHKEY is not set
+    """
+    if SHARD_AUTHKEY:
+        return SHARD_AUTHKEY
+    if isinstance(address, tuple):
+        raise ShardError("SHARD_AUTHKEY must be set to serve or reach shards over TCP")
+    return LOCAL_AUTHKEY
+
+
+def create_shards(n_shards: int):
+    """
+    Splits the full Whoosh index and embedding matrix into n_shards shards.
+
+    Stored fields of the full index already hold the preprocessed text, so
+    documents are copied as they are instead of being preprocessed again.
+    The generation the shards were cut from is recorded in their manifest.
+    """
+    from whoosh.index import create_in
+    from .search_preprocessing import load_whoosh_index, load_embeddings
+
+    generation = active_generation()
+    print(f"Creating {n_shards} shards from snapshot {generation}...")
+    source = load_whoosh_index()
+    base = os.path.join(SHARD_DIR, f"{n_shards}")
+    tmp_base = base + '.tmp'
+    shutil.rmtree(tmp_base, ignore_errors=True)
+
+    writers = []
+    for shard in range(n_shards):
+        index_dir = os.path.join(tmp_base, f"shard_{shard}", 'whoosh_index')
+        os.makedirs(index_dir)
+        writers.append(create_in(index_dir, source.schema).writer())
+    with source.searcher() as searcher:
+        for fields in searcher.all_stored_fields():
+            writers[shard_of(int(fields['id']), n_shards)].add_document(**fields)
+    for writer in writers:
+        writer.commit()
+
+    recipe_ids, embeddings = load_embeddings()
+    recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+    for shard in range(n_shards):
+        mask = recipe_ids % n_shards == shard
+        shard_dir = os.path.join(tmp_base, f"shard_{shard}")
+        np.save(os.path.join(shard_dir, 'ids.npy'), recipe_ids[mask])
+        np.save(os.path.join(shard_dir, 'embeddings.npy'), embeddings[mask])
+        print(f"Shard {shard}: {int(mask.sum())} recipes")
+    with open(os.path.join(tmp_base, SHARD_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'generation': generation, 'shards': n_shards, 'recipe_count': len(recipe_ids)}, f, indent=2)
+
+    shutil.rmtree(base, ignore_errors=True)
+    os.replace(tmp_base, base)
+    print(f"Shards written to {base}")
+
+
+def bm25_idf(doc_count: int, doc_frequency: int) -> float:
+    """Whoosh's BM25F idf, computed from global counts."""
+    return math.log(doc_count / (doc_frequency + 1)) + 1
+
+
+def _global_bm25f(stats: Dict):
+    """BM25F weighting that takes idf and average field lengths from corpus-wide stats."""
+    from whoosh.scoring import BM25F, BM25FScorer
+
+    class GlobalBM25FScorer(BM25FScorer):
+        # Same as BM25FScorer.__init__, but setup() (which computes the max
+        # quality used for block skipping) must already see the global values
+        def __init__(self, searcher, fieldname, text, B, K1, qf=1):
+            # Postings hand the term over as bytes, the query parser as str
+            term = text.decode('utf-8') if isinstance(text, bytes) else text
+            doc_frequency = stats['doc_frequency'].get((fieldname, term), 0)
+            self.idf = bm25_idf(stats['doc_count'], doc_frequency)
+            self.avgfl = stats['field_length'].get(fieldname, 0) / (stats['doc_count'] or 1) or 1
+            self.B = B
+            self.K1 = K1
+            self.qf = qf
+            self.setup(searcher, fieldname, text)
+
+    class GlobalBM25F(BM25F):
+        def scorer(self, searcher, fieldname, text, qf=1):
+            if not searcher.schema[fieldname].scorable:
+                return super().scorer(searcher, fieldname, text, qf=qf)
+            B = self._field_B.get(fieldname, self.B)
+            return GlobalBM25FScorer(searcher, fieldname, text, B, self.K1, qf=qf)
+
+    return GlobalBM25F()
+
+
+class ShardWorker:
+    """
+    Serves BM25 and embedding search over one shard.
+
+    Only the operations in OPS can be called over a connection.
+    """
+
+    OPS = ('ping', 'stats', 'bm25', 'embedding')
+
+    def __init__(self, shard: int, n_shards: int):
+        from whoosh.index import open_dir
+        from whoosh.qparser import MultifieldParser
+
+        path = shard_path(shard, n_shards)
+        self.shard = shard
+        self.generation = read_shard_manifest(n_shards).get('generation')
+        if self.generation != current_generation():
+            logger.warning(f"Shard {shard} was built from snapshot {self.generation}, "
+                           f"the published one is {current_generation()}; rebuild the shards")
+        self.index = open_dir(os.path.join(path, 'whoosh_index'))
+        self.parser = MultifieldParser(SHARD_FIELDS, schema=self.index.schema)
+        self.ids = np.load(os.path.join(path, 'ids.npy'))
+        self.embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+
+    def ping(self) -> Dict:
+        return {'shard': self.shard, 'recipes': len(self.ids), 'generation': self.generation}
+
+    def stats(self, query: str) -> Dict:
+        """Local document count, field lengths and document frequencies of the query terms."""
+        parsed = self.parser.parse(query)
+        with self.index.searcher() as searcher:
+            terms = {(field, text) for field, text in parsed.iter_all_terms() if field in SHARD_FIELDS}
+            return {
+                'doc_count': searcher.doc_count_all(),
+                'field_length': {f: searcher.field_length(f) for f in SHARD_FIELDS},
+                'doc_frequency': {t: searcher.doc_frequency(*t) for t in terms},
+            }
+
+    def bm25(self, query: str, limit: int, stats: Dict) -> List[Tuple[int, float]]:
+        parsed = self.parser.parse(query)
+        with self.index.searcher(weighting=_global_bm25f(stats)) as searcher:
+            return [(int(hit['id']), hit.score) for hit in searcher.search(parsed, limit=limit)]
+
+    def embedding(self, vector: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+        if not len(self.ids):
+            return []
+        scores = self.embeddings @ np.asarray(vector, dtype=np.float32).ravel()
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+    def handle(self, conn):
+        """Answers requests on one coordinator connection until it closes."""
+        try:
+            while True:
+                op, args = conn.recv()
+                try:
+                    if op not in self.OPS:
+                        raise ValueError(f"Unknown shard operation: {op!r}")
+                    result = getattr(self, op)(**args)
+                    conn.send(('ok', result))
+                except Exception as e:
+                    logger.exception(f"Shard {self.shard}: {op} failed")
+                    conn.send(('error', str(e)))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve(self, address):
+        with Listener(address, authkey=shard_authkey(address)) as listener:
+            logger.info(f"Shard {self.shard} serving {len(self.ids)} recipes on {address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+class ShardCoordinator:
+    """
+    Fans queries out to the shard workers and merges their top-k.
+
+    Each shard gets a small pool of persistent connections so concurrent
+    requests do not queue behind each other on one socket.
+    """
+
+    def __init__(self, addresses: Sequence[str], timeout: float = SHARD_TIMEOUT_S):
+        self.addresses = [parse_address(a) for a in addresses]
+        self.timeout = timeout
+        self._pools = [queue.LifoQueue() for _ in self.addresses]
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.addresses)),
+                                            thread_name_prefix='shard')
+        # Generation all shards were found to match; None until checked
+        self._verified_generation = None
+        self._mismatch = None
+        on_snapshot_change(self._reset_generation)
+
+    def _reset_generation(self):
+        self._verified_generation = None
+
+    def _call(self, shard: int, op: str, **args):
+        pool = self._pools[shard]
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            try:
+                address = self.addresses[shard]
+                conn = Client(address, authkey=shard_authkey(address))
+            except OSError as e:
+                raise ShardError(f"Shard {shard} unreachable: {e}") from e
+        try:
+            conn.send((op, args))
+            if not conn.poll(self.timeout):
+                raise ShardError(f"Shard {shard} timed out after {self.timeout}s")
+            status, result = conn.recv()
+        except Exception:
+            # The connection may have a late answer queued; never reuse it
+            conn.close()
+            raise
+        pool.put(conn)
+        if status != 'ok':
+            raise ShardError(f"Shard {shard}: {result}")
+        return result
+
+    def _fan_out(self, op: str, **args) -> List:
+        futures = [self._executor.submit(self._call, shard, op, **args)
+                   for shard in range(len(self.addresses))]
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _merge(per_shard: List[List[Tuple[int, float]]], limit: int) -> List[Tuple[int, float]]:
+        return heapq.nlargest(limit, (hit for hits in per_shard for hit in hits), key=lambda h: h[1])
+
+    def check_generation(self):
+        """
+        Makes sure every shard was built from the snapshot this process serves.
+
+        Checked once per active generation; while shards are stale they are
+        asked again on every call, so restarted workers are picked up.
+
+        Raises:
+            ShardError: A shard was built from another generation
+        """
+        generation = active_generation()
+        if generation == self._verified_generation:
+            return
+        stale = {info['shard']: info.get('generation') for info in self.ping()
+                 if info.get('generation') != generation}
+        if stale:
+            mismatch = (f"Shards were built from another snapshot than {generation}: {stale}; "
+                        f"rebuild them with `python -m app.shards build` and restart the workers")
+            if mismatch != self._mismatch:
+                logger.warning(mismatch)
+                self._mismatch = mismatch
+            raise ShardError(mismatch)
+        self._verified_generation = generation
+        self._mismatch = None
+
+    def global_stats(self, query: str) -> Dict:
+        """Sums the per-shard BM25 statistics for the terms of a query."""
+        stats = {'doc_count': 0, 'field_length': {}, 'doc_frequency': {}}
+        for shard_stats in self._fan_out('stats', query=query):
+            stats['doc_count'] += shard_stats['doc_count']
+            for field, length in shard_stats['field_length'].items():
+                stats['field_length'][field] = stats['field_length'].get(field, 0) + length
+            for term, df in shard_stats['doc_frequency'].items():
+                stats['doc_frequency'][term] = stats['doc_frequency'].get(term, 0) + df
+        return stats
+
+    def search_bm25(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Global top-k (recipe_id, score) by BM25F with corpus-wide statistics."""
+        self.check_generation()
+        stats = self.global_stats(query)
+        return self._merge(self._fan_out('bm25', query=query, limit=limit, stats=stats), limit)
+
+    def search_embedding(self, vector, limit: int) -> List[Tuple[int, float]]:
+        """Global top-k (recipe_id, cosine) for a query embedding."""
+        self.check_generation()
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return self._merge(self._fan_out('embedding', vector=vector, limit=limit), limit)
+
+    def ping(self) -> List[Dict]:
+        return self._fan_out('ping')
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator() -> Optional[ShardCoordinator]:
+    """The process-wide coordinator, or None when SHARD_ADDRESSES is not set."""
+    global _coordinator
+    if not SHARD_ADDRESSES:
+        return None
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = ShardCoordinator(SHARD_ADDRESSES)
+    return _coordinator
+
+
+def _wait_until_ready(coordinator: ShardCoordinator, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return coordinator.ping()
+        except ShardError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and serve search shards')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Split the preprocessed index and embeddings into shards')
+    build.add_argument('--shards', type=int, required=True)
+    serve = sub.add_parser('serve', help='Serve one shard')
+    serve.add_argument('--shard', type=int, required=True)
+    serve.add_argument('--shards', type=int, required=True)
+    serve.add_argument('--address', required=True, help='host:port or unix socket path')
+    launch = sub.add_parser('launch', help='Serve all shards as local worker processes')
+    launch.add_argument('--shards', type=int, required=True)
+    launch.add_argument('--base-port', type=int, default=SHARD_BASE_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'build':
+        create_shards(args.shards)
+    elif args.command == 'serve':
+        address = parse_address(args.address)
+        try:
+            shard_authkey(address)
+        except ShardError as e:
+            parser.error(str(e))
+        ShardWorker(args.shard, args.shards).serve(address)
+    else:
+        global SHARD_AUTHKEY
+        if not SHARD_AUTHKEY:
+            # Local workers only; the key is handed to them and printed for the API
+            SHARD_AUTHKEY = secrets.token_hex(16).encode()
+        env = dict(os.environ, SHARD_AUTHKEY=SHARD_AUTHKEY.decode())
+        # SIGTERM (docker stop) must unwind through the finally below, or the workers are orphaned;
+        # handlers are reset to the default in the workers by exec
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        signal.signal(signal.SIGINT, _exit_on_signal)
+        addresses = [f"127.0.0.1:{args.base_port + i}" for i in range(args.shards)]
+        workers = [
+            subprocess.Popen([sys.executable, '-m', 'app.shards', 'serve', '--shard', str(i),
+                              '--shards', str(args.shards), '--address', address], env=env)
+            for i, address in enumerate(addresses)
+        ]
+        try:
+            print(f"Shards ready: {_wait_until_ready(ShardCoordinator(addresses))}")
+            print(f"SHARD_ADDRESSES={','.join(addresses)}")
+            print(f"SHARD_AUTHKEY={SHARD_AUTHKEY.decode()}")
+            while True:
+                signal.pause()
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+
+
+if __name__ == '__main__':
+    main()
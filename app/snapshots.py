@@ -0,0 +1,411 @@
+"""
+Versioned snapshots of the preprocessed search artifacts.
+
+Every build writes a complete generation into PREPROCESSED_DIR/snapshots/
+<generation>/: the Whoosh index, embeddings, neighbours and the other
+lookup tables, plus a MANIFEST.json describing them (recipe count, checksum
+of the recipe ids, encoder model, build time, format versions). A build
+starts from a hard-linked copy of the current generation, so incremental
+updates only rewrite what changed, and nothing in a published generation
+is ever modified again. Writers must therefore replace artifact files
+(tmp file + os.replace) instead of rewriting them in place.
+
+Publishing is an atomic replace of the CURRENT pointer file. Running
+processes check the pointer at the start of a request (at most every
+SNAPSHOT_CHECK_SECONDS), and on a change drop their cached artifacts, which
+are then reloaded from the new generation. Older generations are kept
+around (KEEP_GENERATIONS) for requests still reading them and for rollback.
+
+    python -m app.snapshots status
+    python -m app.snapshots verify [generation]
+    python -m app.snapshots rollback <generation>
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREPROCESSED_DIR = os.environ.get(
+    'PREPROCESSED_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocessed')
+)
+SNAPSHOTS_DIR = os.path.join(PREPROCESSED_DIR, 'snapshots')
+CURRENT_FILE = os.path.join(PREPROCESSED_DIR, 'CURRENT')
+LOCK_FILE = os.path.join(PREPROCESSED_DIR, '.snapshot.lock')
+MANIFEST_FILE = 'MANIFEST.json'
+
+KEEP_GENERATIONS = int(os.environ.get('SNAPSHOT_KEEP_GENERATIONS', 3))
+SNAPSHOT_CHECK_SECONDS = float(os.environ.get('SNAPSHOT_CHECK_SECONDS', 2))
+
+# Bump an entry whenever the on-disk layout of that artifact changes
+FORMAT_VERSIONS = {
+    'manifest': 1,
+    'whoosh_index': 1,
+    'embeddings': 1,
+    'spelling': 1,
+    'suggest': 1,
+    'query_embeddings': 1,
+    'neighbours': 1,
+    'multivector': 1,
+}
+# Whoosh rewrites lock and TOC files inside its directory, so it is copied instead of hard-linked
+COPIED_ARTIFACTS = ('whoosh_index',)
+
+_build_dir: ContextVar[Optional[str]] = ContextVar('snapshot_build_dir', default=None)
+_active: Optional[str] = None
+_checked_at = float('-inf')
+_callbacks: List[Callable[[], None]] = []
+_lock = threading.Lock()
+# Whether this thread holds the build lock, so new_generation() can run inside build_lock()
+_lock_owner = threading.local()
+
+
+class SnapshotError(RuntimeError):
+    """A snapshot is incomplete, inconsistent or incompatible with this code."""
+
+
+def generation_dir(generation: str) -> str:
+    return os.path.join(SNAPSHOTS_DIR, generation)
+
+
+def current_generation() -> Optional[str]:
+    """Generation the CURRENT pointer names, or None if nothing was published yet."""
+    try:
+        with open(CURRENT_FILE, encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def active_generation() -> Optional[str]:
+    """Generation this process is serving from."""
+    if _active is None:
+        refresh_snapshot(force=True)
+    return _active
+
+
+def artifact_path(name: str) -> str:
+    """
+    Path of an artifact in the generation being built by this thread, else in the active one.
+
+    Before the first snapshot is published this falls back to PREPROCESSED_DIR itself.
+    """
+    building = _build_dir.get()
+    if building is not None:
+        return os.path.join(building, name)
+    generation = active_generation()
+    return os.path.join(generation_dir(generation) if generation else PREPROCESSED_DIR, name)
+
+
+def on_snapshot_change(callback: Callable[[], None]):
+    """Registers a function that drops cached artifacts when the active generation changes."""
+    _callbacks.append(callback)
+
+
+def refresh_snapshot(force: bool = False) -> Optional[str]:
+    """
+    Switches to the published generation if it changed since the last check.
+
+    Called at the start of each request; the pointer file is read at most
+    every SNAPSHOT_CHECK_SECONDS. A generation that fails the manifest check
+    is not switched to, and the current one keeps serving.
+
+    Returns:
+        The active generation
+    """
+    global _active, _checked_at
+    now = time.monotonic()
+    if not force and now - _checked_at < SNAPSHOT_CHECK_SECONDS:
+        return _active
+
+    with _lock:
+        _checked_at = now
+        generation = current_generation()
+        if generation is None or generation == _active:
+            return _active
+        try:
+            verify_snapshot(generation_dir(generation), full=False)
+        except SnapshotError as e:
+            logger.error(f"Not switching to snapshot {generation}: {e}")
+            return _active
+        previous, _active = _active, generation
+
+    for callback in _callbacks:
+        callback()
+    if previous is not None:
+        logger.info(f"Switched from snapshot {previous} to {generation}")
+    return generation
+
+
+def ids_checksum(recipe_ids) -> str:
+    """Order-independent checksum of a set of recipe ids."""
+    ids = np.sort(np.asarray(list(recipe_ids), dtype=np.int64))
+    return hashlib.blake2b(ids.tobytes(), digest_size=16).hexdigest()
+
+
+def _index_ids(directory: str) -> List[int]:
+    from whoosh.index import open_dir
+    from .search_preprocessing import WHOOSH_INDEX_DIR
+
+    with open_dir(os.path.join(directory, WHOOSH_INDEX_DIR)).searcher() as searcher:
+        return [int(fields['id']) for fields in searcher.all_stored_fields()]
+
+
+def _embeddings(directory: str):
+    import pickle
+    from .search_preprocessing import EMBEDDINGS_FILE
+
+    with open(os.path.join(directory, EMBEDDINGS_FILE), 'rb') as f:
+        data = pickle.load(f)
+    return data['recipe_ids'], np.asarray(data['embeddings'])
+
+
+def _db_recipe_count() -> Optional[int]:
+    """Number of recipes in the database, if an app context is available."""
+    try:
+        from .models import Recipe
+        return Recipe.query.count()
+    except Exception:
+        return None
+
+
+def write_manifest(directory: str, generation: str, parent: Optional[str]) -> Dict:
+    """Describes the artifacts in a generation directory and writes MANIFEST.json."""
+    import whoosh
+    from .encoder import MODEL_NAME, ENCODER_BACKEND
+
+    index_ids = _index_ids(directory)
+    _, embeddings = _embeddings(directory)
+    manifest = {
+        'generation': generation,
+        'parent': parent,
+        'build_time': datetime.now(timezone.utc).isoformat(),
+        'recipe_count': len(index_ids),
+        'id_checksum': ids_checksum(index_ids),
+        'db_recipe_count': _db_recipe_count(),
+        'model_name': MODEL_NAME,
+        'encoder_backend': ENCODER_BACKEND,
+        'embedding_dim': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        'format_versions': FORMAT_VERSIONS,
+        'libraries': {'whoosh': whoosh.versionstring(), 'numpy': np.__version__},
+        'artifacts': sorted(name for name in os.listdir(directory) if name != MANIFEST_FILE),
+    }
+    tmp_file = os.path.join(directory, MANIFEST_FILE + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, os.path.join(directory, MANIFEST_FILE))
+    return manifest
+
+
+def read_manifest(directory: str) -> Dict:
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Unreadable manifest in {directory}: {e}") from e
+
+
+def verify_snapshot(directory: Optional[str] = None, full: bool = True) -> Dict:
+    """
+    Checks that a generation can be served by this code, and with full=True that its artifacts agree.
+
+    The quick check covers the manifest, format versions and encoder model.
+    The full check also requires the Whoosh index, the embeddings, the
+    neighbour table and the multi-vector store to hold exactly the recipe ids
+    recorded in the manifest.
+
+    Args:
+        directory: Generation directory (default: the active one)
+        full: Also open the artifacts and compare their recipe ids
+
+    Returns:
+        The manifest
+
+    Raises:
+        SnapshotError: On the first problem found
+    """
+    from .encoder import MODEL_NAME
+
+    if directory is None:
+        generation = active_generation()
+        if generation is None:
+            raise SnapshotError("No snapshot has been published")
+        directory = generation_dir(generation)
+    manifest = read_manifest(directory)
+
+    for artifact, version in FORMAT_VERSIONS.items():
+        built = manifest.get('format_versions', {}).get(artifact)
+        if built != version:
+            raise SnapshotError(f"{artifact} format {built} in {directory}, this code reads {version}")
+    if manifest.get('model_name') != MODEL_NAME:
+        raise SnapshotError(f"Embeddings built with {manifest.get('model_name')}, encoder is {MODEL_NAME}")
+    missing = [name for name in manifest.get('artifacts', []) if not os.path.exists(os.path.join(directory, name))]
+    if missing:
+        raise SnapshotError(f"Missing artifacts in {directory}: {missing}")
+    if not full:
+        return manifest
+
+    from .neighbours import NEIGHBOURS_FILE
+    from .multivector import MULTIVECTOR_FILE
+
+    expected = manifest['id_checksum']
+    index_ids = _index_ids(directory)
+    if len(index_ids) != manifest['recipe_count'] or ids_checksum(index_ids) != expected:
+        raise SnapshotError(f"Whoosh index holds {len(index_ids)} recipes that do not match the manifest")
+    embedding_ids, embeddings = _embeddings(directory)
+    if len(embedding_ids) != len(embeddings):
+        raise SnapshotError(f"{len(embedding_ids)} embedding ids for {len(embeddings)} vectors")
+    if ids_checksum(embedding_ids) != expected:
+        raise SnapshotError(f"Embeddings cover {len(embedding_ids)} recipes, the index "
+                            f"{len(index_ids)}; they were built from different data")
+    neighbours_file = os.path.join(directory, NEIGHBOURS_FILE)
+    if os.path.exists(neighbours_file) and ids_checksum(np.load(neighbours_file)['ids']) != expected:
+        raise SnapshotError("Neighbour table does not match the index")
+    multivector_file = os.path.join(directory, MULTIVECTOR_FILE)
+    if os.path.exists(multivector_file) and ids_checksum(np.load(multivector_file)['ids']) != expected:
+        raise SnapshotError("Multi-vector embeddings do not match the index")
+    return manifest
+
+
+@contextmanager
+def build_lock():
+    """
+    Serializes builds across threads and processes; re-entrant within a thread.
+
+    Hold it around a check of the current generation and the new_generation()
+    that acts on it, so no other process publishes in between.
+    """
+    if getattr(_lock_owner, 'held', False):
+        yield
+        return
+    os.makedirs(PREPROCESSED_DIR, exist_ok=True)
+    with open(LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _lock_owner.held = True
+        try:
+            yield
+        finally:
+            _lock_owner.held = False
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _link_or_copy(source: str, target: str):
+    if any(part in COPIED_ARTIFACTS for part in source.split(os.sep)):
+        shutil.copy2(source, target)
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _publish(generation: str):
+    tmp_file = CURRENT_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(generation + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, CURRENT_FILE)
+
+
+def prune_generations(keep: int = KEEP_GENERATIONS):
+    """Deletes all but the newest `keep` generations; the current one is always kept."""
+    current = current_generation()
+    generations = sorted(name for name in os.listdir(SNAPSHOTS_DIR) if not name.endswith('.building'))
+    for name in generations[:-keep] if keep > 0 else generations:
+        if name != current:
+            shutil.rmtree(generation_dir(name), ignore_errors=True)
+
+
+@contextmanager
+def new_generation(incremental: bool = True):
+    """
+    Builds a new generation and publishes it if the block succeeds.
+
+    Inside the block artifact_path() points at the staging directory (in
+    this thread only), so the usual create_*/update_* functions write there.
+    After the block the manifest is written, the generation is fully
+    verified, and only then the CURRENT pointer is swapped. On any error the
+    staging directory is removed and the current generation stays live.
+
+    Args:
+        incremental: Start from a copy of the current generation instead of an empty directory
+    """
+    with build_lock():
+        os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
+        for name in os.listdir(SNAPSHOTS_DIR):
+            if name.endswith('.building'):
+                shutil.rmtree(generation_dir(name), ignore_errors=True)
+
+        parent = current_generation() if incremental else None
+        generation = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}"
+        staging = generation_dir(generation + '.building')
+        if parent:
+            shutil.copytree(generation_dir(parent), staging, copy_function=_link_or_copy,
+                            ignore=shutil.ignore_patterns('*WRITELOCK', '*.tmp*', MANIFEST_FILE))
+        else:
+            os.makedirs(staging)
+
+        token = _build_dir.set(staging)
+        try:
+            yield staging
+            write_manifest(staging, generation, parent)
+            verify_snapshot(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        finally:
+            _build_dir.reset(token)
+
+        os.replace(staging, generation_dir(generation))
+        _publish(generation)
+        prune_generations()
+        print(f"Published snapshot {generation}")
+    refresh_snapshot(force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and manage preprocessed snapshots')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='List generations and the current one')
+    verify = sub.add_parser('verify', help='Run the full consistency check')
+    verify.add_argument('generation', nargs='?')
+    rollback = sub.add_parser('rollback', help='Point CURRENT at an older generation')
+    rollback.add_argument('generation')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        current = current_generation()
+        for name in sorted(os.listdir(SNAPSHOTS_DIR)) if os.path.exists(SNAPSHOTS_DIR) else []:
+            try:
+                manifest = read_manifest(generation_dir(name))
+                summary = f"{manifest['recipe_count']} recipes, {manifest['model_name']}, built {manifest['build_time']}"
+            except SnapshotError as e:
+                summary = str(e)
+            print(f"{'*' if name == current else ' '} {name}: {summary}")
+    elif args.command == 'verify':
+        generation = args.generation or current_generation()
+        manifest = verify_snapshot(generation_dir(generation))
+        print(f"{generation} is consistent: {manifest['recipe_count']} recipes, checksum {manifest['id_checksum']}")
+    else:
+        with build_lock():
+            verify_snapshot(generation_dir(args.generation))
+            _publish(args.generation)
+        print(f"CURRENT now points at {args.generation}")
+
+
+if __name__ == '__main__':
+    main()
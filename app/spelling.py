@@ -0,0 +1,179 @@
+"""
+Spelling correction for BM25 queries, SymSpell style.
+
+At index time every term of the Whoosh index is stored with its frequency,
+and every variant of its first PREFIX_LENGTH characters with up to
+MAX_EDIT_DISTANCE deletions points back to it. A misspelled query word only
+needs the same deletions generated to find candidates, which are then
+verified with a real edit distance.
+"""
+import os
+import re
+import time
+import pickle
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from .snapshots import artifact_path, on_snapshot_change
+
+SPELLING_FILE = 'spelling.pkl'
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7
+MIN_WORD_LENGTH = 3
+SPELLING_BUDGET_MS = float(os.environ.get('SPELLING_BUDGET_MS', 5))
+
+INDEXED_FIELDS = ["name", "ingredients", "text"]
+_WORD = re.compile(r'^\w+$')
+_OPERATORS = {'AND', 'OR', 'NOT', 'ANDNOT', 'ANDMAYBE'}
+
+_spelling_index = None
+
+
+def _deletes(word: str, max_distance: int = MAX_EDIT_DISTANCE) -> set:
+    """All strings obtained from word by removing up to max_distance characters."""
+    variants = {word}
+    for distance in range(1, min(max_distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), distance):
+            variants.add(''.join(c for i, c in enumerate(word) if i not in positions))
+    return variants
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, giving up once it exceeds max_distance."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def create_spelling_index(ix=None):
+    """
+    Builds the deletion index from the Whoosh index vocabulary.
+
+    Args:
+        ix: Open Whoosh index (loaded from WHOOSH_INDEX_DIR if omitted)
+    """
+    from .search_preprocessing import load_whoosh_index
+
+    print("Creating spelling index...")
+    ix = ix or load_whoosh_index()
+    frequencies: Dict[str, int] = {}
+    with ix.reader() as reader:
+        for field in INDEXED_FIELDS:
+            for term in reader.lexicon(field):
+                term = term.decode('utf-8') if isinstance(term, bytes) else term
+                if len(term) < MIN_WORD_LENGTH or not _WORD.match(term):
+                    continue
+                frequencies[term] = frequencies.get(term, 0) + int(reader.frequency(field, term))
+
+    terms = sorted(frequencies)
+    deletes: Dict[str, List[int]] = {}
+    for term_id, term in enumerate(terms):
+        for variant in _deletes(term[:PREFIX_LENGTH]):
+            deletes.setdefault(variant, []).append(term_id)
+
+    tmp_file = artifact_path(SPELLING_FILE) + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump({
+            'terms': terms,
+            'frequencies': [frequencies[t] for t in terms],
+            'deletes': deletes,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, artifact_path(SPELLING_FILE))
+
+    global _spelling_index
+    _spelling_index = None
+    print(f"Spelling index created: {len(terms)} terms, {len(deletes)} delete variants.")
+
+
+def load_spelling_index():
+    """Loads the spelling index once per process; returns None if it was never built."""
+    global _spelling_index
+    if _spelling_index is None:
+        spelling_file = artifact_path(SPELLING_FILE)
+        if not os.path.exists(spelling_file):
+            return None
+        with open(spelling_file, 'rb') as f:
+            data = pickle.load(f)
+        vocabulary = {term: freq for term, freq in zip(data['terms'], data['frequencies'])}
+        _spelling_index = (data['terms'], vocabulary, data['deletes'])
+    return _spelling_index
+
+
+def _reset():
+    global _spelling_index
+    _spelling_index = None
+
+
+on_snapshot_change(_reset)
+
+
+def correct_word(word: str) -> Optional[str]:
+    """
+    Returns the best correction for a word missing from the vocabulary.
+
+    Closest edit distance wins, ties go to the more frequent term.
+    None means the word is known, too short, or has no close match.
+    """
+    index = load_spelling_index()
+    if index is None or len(word) < MIN_WORD_LENGTH:
+        return None
+    terms, vocabulary, deletes = index
+    if word in vocabulary:
+        return None
+
+    # Two edits turn most short words into some other word, so they get only one
+    max_distance = 1 if len(word) <= 5 else MAX_EDIT_DISTANCE
+    best: Tuple[int, int, str] = None
+    seen = set()
+    for variant in _deletes(word[:PREFIX_LENGTH], max_distance):
+        for term_id in deletes.get(variant, ()):
+            if term_id in seen:
+                continue
+            seen.add(term_id)
+            term = terms[term_id]
+            distance = _edit_distance(word, term, max_distance)
+            if distance > max_distance:
+                continue
+            candidate = (distance, -vocabulary[term], term)
+            if best is None or candidate < best:
+                best = candidate
+    return best[2] if best else None
+
+
+def correct_query(query: str, budget_ms: float = SPELLING_BUDGET_MS) -> Optional[str]:
+    """
+    Rewrites unknown words of a query to their closest indexed terms.
+
+    Whoosh syntax (operators, field:value, quotes, wildcards) is left alone.
+    Correction stops once budget_ms is spent; the words handled so far are kept.
+
+    Returns:
+        The corrected query, or None if nothing was changed
+    """
+    if load_spelling_index() is None:
+        return None
+    deadline = time.perf_counter() + budget_ms / 1000
+    words = query.split()
+    changed = False
+    for i, word in enumerate(words):
+        if time.perf_counter() > deadline:
+            break
+        if word in _OPERATORS or not _WORD.match(word):
+            continue
+        correction = correct_word(word.lower())
+        if correction:
+            words[i] = correction
+            changed = True
+    return ' '.join(words) if changed else None
@@ -0,0 +1,150 @@
+"""
+Typeahead suggestions over recipe names and ingredients.
+
+The index is a sorted list of lowercase keys with a parallel list of entries
+(display text, kind, popularity weight), built during preprocessing and kept
+in memory. A prefix lookup is a bisect into the keys; short prefixes, whose
+ranges can span thousands of keys, have their top suggestions precomputed.
+"""
+import os
+import json
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List
+
+from .search_preprocessing import parse_ingredients
+from .snapshots import artifact_path, on_snapshot_change
+
+SUGGEST_FILE = 'suggest.json'
+PRECOMPUTED_PREFIX_LEN = 3
+PRECOMPUTED_TOP_K = 20
+MAX_SCAN = 2000
+
+_index = None
+
+
+def normalize_prefix(text: str) -> str:
+    """Lowercases and collapses whitespace, the form all keys are stored in."""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def create_suggest_index():
+    """
+    Builds the suggestion index from recipe names and ingredients.
+
+    Names are weighted by likes + bookmarks and indexed from every word start,
+    so "карб" finds "Спагетти карбонара". Ingredients are weighted by the
+    summed popularity of the recipes that use them.
+    """
+    from .models import Recipe
+
+    print("Creating suggest index...")
+    names: Dict[str, List] = {}
+    ingredients: Dict[str, List] = defaultdict(lambda: ['', 0])
+
+    rows = Recipe.query.with_entities(
+        Recipe.name, Recipe.ingredients, Recipe.likes, Recipe.bookmarks
+    ).all()
+    for name, ingredient_list, likes, bookmarks in rows:
+        popularity = 1 + (likes or 0) + (bookmarks or 0)
+        if name:
+            entry = names.setdefault(normalize_prefix(name), [name.strip(), 0])
+            entry[1] += popularity
+        for ingredient in parse_ingredients(ingredient_list):
+            entry = ingredients[normalize_prefix(ingredient)]
+            entry[0] = entry[0] or ingredient
+            entry[1] += popularity
+
+    entries = []
+    for kind, source in (('recipe', names), ('ingredient', ingredients)):
+        for key, (display, weight) in source.items():
+            words = key.split(' ')
+            for i in range(len(words)):
+                entries.append((' '.join(words[i:]), display, kind, weight))
+    entries.sort(key=lambda e: (e[0], -e[3]))
+
+    keys = [e[0] for e in entries]
+    payload = [[e[1], e[2], e[3]] for e in entries]
+
+    top_prefixes = defaultdict(list)
+    for position, key in enumerate(keys):
+        for length in range(1, min(PRECOMPUTED_PREFIX_LEN, len(key)) + 1):
+            top_prefixes[key[:length]].append(position)
+    top_prefixes = {
+        prefix: _top_positions(positions, payload, PRECOMPUTED_TOP_K)
+        for prefix, positions in top_prefixes.items()
+    }
+
+    tmp_file = artifact_path(SUGGEST_FILE) + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'keys': keys, 'entries': payload, 'top_prefixes': top_prefixes}, f, ensure_ascii=False)
+    os.replace(tmp_file, artifact_path(SUGGEST_FILE))
+
+    global _index
+    _index = None
+    print(f"Suggest index created: {len(names)} recipe names, {len(ingredients)} ingredients, "
+          f"{len(keys)} keys.")
+
+
+def _top_positions(positions, payload, k: int) -> List[int]:
+    """Positions of the k heaviest entries, one per display text."""
+    best = {}
+    for position in positions:
+        display, kind, weight = payload[position]
+        current = best.get((display, kind))
+        if current is None or weight > payload[current][2]:
+            best[(display, kind)] = position
+    return heapq.nlargest(k, best.values(), key=lambda p: payload[p][2])
+
+
+def load_suggest_index():
+    """Loads the index once per process."""
+    global _index
+    if _index is None:
+        suggest_file = artifact_path(SUGGEST_FILE)
+        if not os.path.exists(suggest_file):
+            raise FileNotFoundError("Suggest index does not exist.")
+        with open(suggest_file, encoding='utf-8') as f:
+            data = json.load(f)
+        _index = (data['keys'], data['entries'], data['top_prefixes'])
+    return _index
+
+
+def _reset():
+    global _index
+    _index = None
+
+
+on_snapshot_change(_reset)
+
+
+def suggest(prefix: str, limit: int = 10) -> List[Dict]:
+    """
+    Returns the most popular names and ingredients starting with a prefix.
+
+    Args:
+        prefix: What the user has typed so far
+        limit: Maximum number of suggestions
+
+    Returns:
+        List of {"text", "kind", "weight"} dicts, most popular first
+    """
+    prefix = normalize_prefix(prefix)
+    if not prefix:
+        return []
+    keys, entries, top_prefixes = load_suggest_index()
+
+    if len(prefix) <= PRECOMPUTED_PREFIX_LEN:
+        positions = top_prefixes.get(prefix, [])
+    else:
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and end - start < MAX_SCAN and keys[end].startswith(prefix):
+            end += 1
+        positions = _top_positions(range(start, end), entries, limit)
+
+    return [
+        {'text': entries[p][0], 'kind': entries[p][1], 'weight': entries[p][2]}
+        for p in positions[:limit]
+    ]
@@ -0,0 +1,97 @@
+"""
+Benchmark of query encoding latency for each encoder runtime variant.
+
+For every backend (plain torch, dynamic int8 quantization, ONNX Runtime) and
+thread count, encodes the query file one query at a time and reports the
+per-query latency, throughput and throughput per core. Each variant runs in
+its own subprocess so torch thread settings do not leak between runs.
+
+Usage:
+    python -m benchmarks.encoder_bench --backends torch quantized onnx --threads 1 2 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.search_bench import DEFAULT_QUERIES, load_queries, percentile
+
+
+def run_variant(backend: str, threads: int, queries, repeat: int) -> dict:
+    """Loads one encoder variant in this process and times it."""
+    os.environ['ENCODER_THREADS'] = str(threads)
+    from app.encoder import QueryEncoder, configure_torch_threads
+    configure_torch_threads(threads)
+
+    start = time.perf_counter()
+    encoder = QueryEncoder(backend=backend)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    encoder.encode(queries[0])  # warm-up
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            t = time.perf_counter()
+            encoder.encode(query)
+            latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+
+    batch_start = time.perf_counter()
+    encoder.encode(queries, batch_size=32)
+    batch_qps = len(queries) / (time.perf_counter() - batch_start)
+
+    latencies.sort()
+    qps = len(latencies) / elapsed
+    return {
+        'backend': encoder.backend,
+        'threads': threads,
+        'load_ms': load_ms,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'qps': qps,
+        'qps_per_core': qps / threads,
+        'batch_qps': batch_qps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query encoder runtime benchmark')
+    parser.add_argument('--queries', type=str, default=DEFAULT_QUERIES)
+    parser.add_argument('--backends', nargs='+', default=['torch', 'quantized', 'onnx'],
+                        choices=['torch', 'quantized', 'onnx'])
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--variant', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    queries = [q for q, _ in load_queries(args.queries)]
+
+    if args.variant:
+        backend, threads = args.variant.split(':')
+        print(json.dumps(run_variant(backend, int(threads), queries, args.repeat)))
+        return
+
+    print(f"{'backend':>10} {'threads':>7} | {'load ms':>8} | {'p50':>7} {'p95':>7} {'p99':>7} ms "
+          f"| {'qps':>7} {'qps/core':>8} {'batch qps':>9}")
+    for backend in args.backends:
+        for threads in args.threads:
+            completed = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.encoder_bench', '--queries', args.queries,
+                 '--repeat', str(args.repeat), '--variant', f'{backend}:{threads}'],
+                capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                print(f"{backend:>10} {threads:>7} | failed: {completed.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{r['backend']:>10} {r['threads']:>7} | {r['load_ms']:8.0f} | {r['p50_ms']:7.2f} "
+                  f"{r['p95_ms']:7.2f} {r['p99_ms']:7.2f} ms | {r['qps']:7.1f} {r['qps_per_core']:8.1f} "
+                  f"{r['batch_qps']:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
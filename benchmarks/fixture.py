@@ -0,0 +1,101 @@
+"""
+Offline stand-in for the MySQL database used by the benchmarks.
+
+Loads recipes from one of the CSVs in db/ into a SQLite file, with the same
+column mapping as the LOAD DATA statement in db/init.sql, and points the app
+at it (and at a separate preprocessed/ directory) through environment variables.
+Must be called before anything from `app` is imported.
+"""
+import csv
+import os
+import sqlite3
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CSV = os.path.join(REPO_DIR, 'db', 'final_recipess.csv')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(200) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(255) NOT NULL,
+    type VARCHAR(100),
+    kitchen VARCHAR(100),
+    recipe_text TEXT,
+    ingredient_num INT,
+    portion_num INT,
+    time VARCHAR(50),
+    likes INT DEFAULT 0,
+    dislikes INT DEFAULT 0,
+    bookmarks INT DEFAULT 0,
+    ingredients TEXT,
+    text TEXT
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    recipe_id INT NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    liked BOOLEAN DEFAULT FALSE,
+    bookmarked BOOLEAN DEFAULT FALSE
+);
+"""
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_fixture(directory: str = None, csv_path: str = DEFAULT_CSV, limit: int = None) -> dict:
+    """
+    Creates (or reuses) a SQLite recipe database and exports its settings.
+
+    Args:
+        directory: Where to keep the database and preprocessed artifacts
+                   (default: a new temporary directory)
+        csv_path: Recipe CSV in the final_recipess.csv layout
+        limit: Load at most this many recipes
+
+    Returns:
+        Environment variables that were set (DATABASE_URL, PREPROCESSED_DIR)
+    """
+    directory = directory or tempfile.mkdtemp(prefix='recipe_bench_')
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.join(directory, 'recipes.db')
+
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    if connection.execute("SELECT COUNT(*) FROM recipes").fetchone()[0] == 0:
+        csv.field_size_limit(1 << 30)
+        with open(csv_path, encoding='utf-8', newline='') as f:
+            rows = []
+            for i, row in enumerate(csv.DictReader(f)):
+                if limit is not None and i >= limit:
+                    break
+                rows.append((
+                    row['Name'], row['Type'], row['Kitchen'], row['Recipe'],
+                    _int(row['Ingredient_num']), _int(row['Portion_num']), row['Time'],
+                    _int(row['Likes']) or 0, _int(row['Dislikes']) or 0, _int(row['Bookmarks']) or 0,
+                    row['Ingredients'], row['Text'],
+                ))
+        connection.executemany(
+            "INSERT INTO recipes (name, type, kitchen, recipe_text, ingredient_num, portion_num, "
+            "time, likes, dislikes, bookmarks, ingredients, text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+    connection.close()
+
+    env = {
+        'DATABASE_URL': f'sqlite:///{db_path}',
+        'PREPROCESSED_DIR': os.path.join(directory, 'preprocessed'),
+    }
+    os.environ.update(env)
+    return env
@@ -0,0 +1,104 @@
+"""
+Benchmark of sustained interaction throughput on a single hot recipe.
+
+Many users hammer one recipe with like/dislike/bookmark toggles from several
+threads, then the recipe counters are checked against the interactions table.
+
+Usage:
+    python -m benchmarks.interactions_bench --threads 8 --seconds 10
+    python -m benchmarks.interactions_bench --database-url mysql+pymysql://app_user:app_password@db/recipes_db
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import User, Recipe, Interaction
+from app.interactions import record_interaction
+
+
+def make_app(database_url: str) -> Flask:
+    """Creates a bare Flask app bound to the given database (no search artifacts)."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Interaction counter benchmark')
+    parser.add_argument('--database-url', type=str, default=None,
+                        help='Database to run against (default: temporary SQLite file)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        database_url = f'sqlite:///{path}'
+
+    app = make_app(database_url)
+    with app.app_context():
+        db.create_all()
+        recipe = Recipe(name='Hot recipe', likes=0, dislikes=0, bookmarks=0)
+        db.session.add(recipe)
+        users = [User(username=f'bench_{time.time_ns()}_{i}', password='x') for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        recipe_id = recipe.id
+        user_ids = [u.id for u in users]
+
+    # Each thread owns a disjoint slice of users, like separate browser sessions
+    slices = [user_ids[i::args.threads] for i in range(args.threads)]
+    counts = [0] * args.threads
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(n):
+        rng = random.Random(n)
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                record_interaction(rng.choice(slices[n]), recipe_id,
+                                   rng.choice(['like', 'dislike', 'bookmark']))
+                db.session.remove()
+                counts[n] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        recipe = db.session.get(Recipe, recipe_id)
+        query = db.session.query(func.count(Interaction.id)).filter(Interaction.recipe_id == recipe_id)
+        expected = {
+            'likes': query.filter(Interaction.liked.is_(True)).scalar(),
+            'dislikes': query.filter(Interaction.liked.is_(False)).scalar(),
+            'bookmarks': query.filter(Interaction.bookmarked.is_(True)).scalar(),
+        }
+        actual = {field: getattr(recipe, field) for field in expected}
+
+    total = sum(counts)
+    print(f"Database: {database_url}")
+    print(f"Threads: {args.threads} | Users: {args.users} | Duration: {elapsed:.2f}s")
+    print(f"Interactions: {total} | Throughput: {total / elapsed:.1f} interactions/sec")
+    print(f"Counters: {actual}")
+    print(f"From interactions table: {expected}")
+    print("Consistent" if actual == expected else "INCONSISTENT")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of multi-vector embedding search against the single-vector baseline.
+
+Builds (or reuses) the fixture snapshot, encodes the query file once, and
+then times only the scoring and top-k selection of each variant: the single
+recipe vector (as in /search), max over a recipe's vectors, and the
+field-weighted max. Reports vector counts, file and in-memory sizes,
+p50/p95 scoring latency, and how many of the baseline's top-k each variant
+keeps.
+
+Usage:
+    python -m benchmarks.multivector_bench --k 10 --repeat 5
+"""
+import argparse
+import os
+import time
+
+from benchmarks.search_bench import BENCH_DIR, DEFAULT_QUERIES, load_queries, percentile
+
+
+def time_variant(search, query_vectors, repeat: int):
+    """Runs search(vector) for every query `repeat` times; returns (sorted latencies ms, top ids of the last run)."""
+    latencies, tops = [], []
+    for _ in range(repeat):
+        tops = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            tops.append(search(vector))
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies, tops
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-vector vs single-vector embedding search')
+    parser.add_argument('--queries', type=str, default=DEFAULT_QUERIES)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-fixture', action='store_true',
+                        help='Use DATABASE_URL/PREPROCESSED_DIR from the environment instead of the SQLite fixture')
+    parser.add_argument('--fixture-dir', type=str, default=os.path.join(BENCH_DIR, '.fixture'))
+    args = parser.parse_args()
+
+    if not args.no_fixture:
+        from benchmarks.fixture import build_fixture
+        build_fixture(args.fixture_dir)
+
+    import torch
+    from sentence_transformers import util
+    from app import create_app
+    from app.encoder import get_encoder
+    from app.search_preprocessing import EMBEDDINGS_FILE, load_embeddings
+    from app.multivector import MULTIVECTOR_FILE, load_multivector, search_multivector
+    from app.snapshots import artifact_path
+
+    create_app()
+    queries = [q for q, _ in load_queries(args.queries)]
+    query_vectors = get_encoder().encode(queries).cpu().numpy()
+
+    recipe_ids, embeddings = load_embeddings()
+    embeddings = util.normalize_embeddings(torch.from_numpy(embeddings))
+    store = load_multivector()
+
+    def single(vector):
+        with torch.inference_mode():
+            similarities = util.pytorch_cos_sim(torch.from_numpy(vector).unsqueeze(0), embeddings)[0]
+            top = torch.topk(similarities, min(args.k, len(similarities))).indices.tolist()
+        return [recipe_ids[i] for i in top]
+
+    variants = {
+        'single': single,
+        'max': lambda vector: [rid for rid, _ in search_multivector(vector, args.k, 'max')],
+        'weighted': lambda vector: [rid for rid, _ in search_multivector(vector, args.k, 'weighted')],
+    }
+
+    n_recipes, n_vectors = len(recipe_ids), len(store['vectors'])
+    print(f"Recipes: {n_recipes}, multi-vector segments: {n_vectors} ({n_vectors / max(n_recipes, 1):.1f} per recipe)")
+    print(f"single: {os.path.getsize(artifact_path(EMBEDDINGS_FILE)) / 2**20:.1f} MB on disk, "
+          f"{embeddings.numel() * embeddings.element_size() / 2**20:.1f} MB in memory")
+    print(f"multi:  {os.path.getsize(artifact_path(MULTIVECTOR_FILE)) / 2**20:.1f} MB on disk (float16), "
+          f"{sum(a.nbytes for a in store.values()) / 2**20:.1f} MB in memory")
+    print()
+
+    print(f"{'variant':>9} | {'p50':>7} {'p95':>7} ms | overlap@{args.k} with single")
+    baseline = None
+    for name, search in variants.items():
+        search(query_vectors[0])  # warm-up
+        latencies, tops = time_variant(search, query_vectors, args.repeat)
+        if baseline is None:
+            baseline = tops
+        overlap = sum(len(set(a) & set(b)) for a, b in zip(tops, baseline)) / max(len(queries) * args.k, 1)
+        print(f"{name:>9} | {percentile(latencies, 0.50):7.3f} {percentile(latencies, 0.95):7.3f} ms | {overlap:.2f}")
+
+
+if __name__ == '__main__':
+    main()
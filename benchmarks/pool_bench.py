@@ -0,0 +1,97 @@
+"""
+Load test that saturates the database connection pool with hydration queries.
+
+More threads than pool_size + max_overflow run the `id IN (...)` recipe lookup
+used by every search; the pool counters show how long callers waited and
+whether any hit DB_POOL_TIMEOUT.
+
+Usage:
+    DB_POOL_SIZE=4 DB_MAX_OVERFLOW=2 python -m benchmarks.pool_bench --threads 32
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from app.extensions import db
+from app.models import Recipe
+from app.pool import create_db_engine, pool_status
+from app.queries import fetch_recipes_by_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Connection pool saturation benchmark')
+    parser.add_argument('--database-url', type=str, default=None,
+                        help='Database to run against (default: temporary SQLite file)')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--ids-per-query', type=int, default=10)
+    parser.add_argument('--hold-ms', type=float, default=5.0,
+                        help='Time each session keeps its connection, simulating request work')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        database_url = f'sqlite:///{path}'
+
+    engine = create_db_engine(database_url)
+    Session = sessionmaker(bind=engine)
+    if database_url.startswith('sqlite'):
+        db.metadata.create_all(engine)
+        with Session() as session:
+            session.add_all(Recipe(name=f'Recipe {i}') for i in range(1000))
+            session.commit()
+
+    with Session() as session:
+        all_ids = [rid for (rid,) in session.query(Recipe.id).all()]
+
+    latencies = []
+    errors = {'timeouts': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(n):
+        rng = random.Random(n)
+        local = []
+        while time.perf_counter() < deadline:
+            ids = rng.sample(all_ids, min(args.ids_per_query, len(all_ids)))
+            start = time.perf_counter()
+            try:
+                with Session() as session:
+                    fetch_recipes_by_ids(session, ids)
+                    time.sleep(args.hold_ms / 1000)
+            except PoolTimeoutError:
+                with lock:
+                    errors['timeouts'] += 1
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    print(f"Database: {database_url}")
+    print(f"Threads: {args.threads} | Duration: {elapsed:.2f}s | Queries: {len(latencies)} "
+          f"| QPS: {len(latencies) / elapsed:.1f} | Timeouts: {errors['timeouts']}")
+    print(f"Latency ms: p50={pct(0.5):.2f} p95={pct(0.95):.2f} p99={pct(0.99):.2f}")
+    print(f"Pool: {pool_status(engine)}")
+
+
+if __name__ == '__main__':
+    main()
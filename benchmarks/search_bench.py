@@ -0,0 +1,340 @@
+"""
+Search benchmark that replays a query file against every search method.
+
+Runs in-process (calling the API's search handler directly) and/or over HTTP
+against app/api.py, at a configurable concurrency, and reports p50/p95/p99,
+QPS, memory and cold-vs-warm latency. By default the app runs against the
+offline SQLite fixture from benchmarks/fixture.py, so no MySQL is needed.
+
+Results are written as JSON; pass an earlier file to --compare to see regressions.
+
+Usage:
+    python -m benchmarks.search_bench --mode inprocess --concurrency 4
+    python -m benchmarks.search_bench --mode http --url http://localhost:8000 --no-fixture
+    python -m benchmarks.search_bench --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_QUERIES = os.path.join(BENCH_DIR, 'queries.txt')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+METHODS = ['bm25', 'embedding', 'simple']
+REGRESSION_THRESHOLD = 0.10
+
+
+def load_queries(path: str):
+    """
+    Reads a query log: plain text (one query per line) or JSONL with a "query" key.
+
+    Returns:
+        List of (query, method or None) tuples
+    """
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                queries.append((record['query'], record.get('method')))
+            else:
+                queries.append((line, None))
+    return queries
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors: int, elapsed: float, cold_ms: float) -> dict:
+    """Turns raw per-query latencies (ms) into the reported statistics."""
+    warm = sorted(latencies)
+    return {
+        'queries': len(latencies),
+        'errors': errors,
+        'qps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': sum(warm) / len(warm) if warm else 0.0,
+        'p50_ms': percentile(warm, 0.50),
+        'p95_ms': percentile(warm, 0.95),
+        'p99_ms': percentile(warm, 0.99),
+        'cold_ms': cold_ms,
+    }
+
+
+def replay(run_one, queries, concurrency: int):
+    """
+    Runs every query through run_one at the given concurrency.
+
+    Returns:
+        Tuple of (latencies in ms, error count, wall time in seconds)
+    """
+    def timed(query):
+        start = time.perf_counter()
+        try:
+            run_one(query)
+        except Exception:
+            return None
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    latencies = [t for t in timings if t is not None]
+    return latencies, len(timings) - len(latencies), elapsed
+
+
+def rss_mb(pid: int = None) -> float:
+    """Resident memory of a process in MB (peak RSS for the current process)."""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def replay_async(run_one, queries, concurrency: int):
+    """
+    Like replay(), but for a coroutine: at most `concurrency` queries in flight on the running loop.
+
+    Returns:
+        Tuple of (latencies in ms, error count, wall time in seconds)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(query):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_one(query)
+            except Exception:
+                return None
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(timed(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    latencies = [t for t in timings if t is not None]
+    return latencies, len(timings) - len(latencies), elapsed
+
+
+def bench_inprocess(queries, methods, concurrency: int, limit: int):
+    """
+    Benchmarks the API search handler without going through HTTP.
+
+    All requests run on one event loop, as they would under uvicorn: the
+    handler's admission limiters are asyncio primitives bound to a single loop.
+    """
+    start = time.perf_counter()
+    from app import api
+    from app.database import SessionLocal
+    startup_ms = (time.perf_counter() - start) * 1000
+    print(f"In-process startup: {startup_ms:.0f} ms, RSS {rss_mb():.0f} MB")
+
+    async def run_all():
+        results = []
+        for method in methods:
+            async def run_one(query, method=method):
+                session = SessionLocal()
+                try:
+                    with api.flask_app.app_context():
+                        await api.search_recipes(
+                            query=query, method=api.SearchMethod(method),
+                            limit=limit, offset=0, include_scores=True, deadline_ms=None, db=session)
+                finally:
+                    session.close()
+
+            method_queries = [q for q, m in queries if m in (None, method)]
+            cold_start = time.perf_counter()
+            await run_one(method_queries[0])
+            cold_ms = (time.perf_counter() - cold_start) * 1000
+
+            latencies, errors, elapsed = await replay_async(run_one, method_queries, concurrency)
+            stats = summarize(latencies, errors, elapsed, cold_ms)
+            stats.update({'mode': 'inprocess', 'method': method, 'startup_ms': startup_ms, 'rss_mb': rss_mb()})
+            results.append(stats)
+            print_row(stats)
+        return results
+
+    return asyncio.run(run_all())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(timeout: float = 600.0):
+    """Starts app/api.py under uvicorn with the current environment and waits until it answers."""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.api:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=REPO_DIR,
+    )
+    url = f'http://127.0.0.1:{port}'
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            urllib.request.urlopen(url + '/', timeout=1).read()
+            return process, url, (time.perf_counter() - start) * 1000
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API server did not start in time")
+
+
+def bench_http(queries, methods, concurrency: int, limit: int, url: str = None):
+    """Benchmarks /search over HTTP, starting a local server unless url is given."""
+    process, startup_ms = None, None
+    if url is None:
+        process, url, startup_ms = start_server()
+        print(f"HTTP server startup: {startup_ms:.0f} ms")
+
+    results = []
+    try:
+        for method in methods:
+            def run_one(query, method=method):
+                params = urllib.parse.urlencode({'query': query, 'method': method, 'limit': limit})
+                with urllib.request.urlopen(f'{url}/search?{params}', timeout=60) as response:
+                    response.read()
+
+            method_queries = [q for q, m in queries if m in (None, method)]
+            cold_start = time.perf_counter()
+            run_one(method_queries[0])
+            cold_ms = (time.perf_counter() - cold_start) * 1000
+
+            latencies, errors, elapsed = replay(run_one, method_queries, concurrency)
+            stats = summarize(latencies, errors, elapsed, cold_ms)
+            stats.update({
+                'mode': 'http', 'method': method, 'startup_ms': startup_ms,
+                'rss_mb': rss_mb(process.pid) if process else None,
+            })
+            results.append(stats)
+            print_row(stats)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def print_row(stats: dict):
+    print(f"{stats['mode']:>9} {stats['method']:>9} | n={stats['queries']:<5} err={stats['errors']:<3} "
+          f"qps={stats['qps']:8.1f} | p50={stats['p50_ms']:8.2f} p95={stats['p95_ms']:8.2f} "
+          f"p99={stats['p99_ms']:8.2f} ms | cold={stats['cold_ms']:8.1f} ms")
+
+
+def compare(current: dict, baseline_path: str) -> bool:
+    """
+    Prints per-method changes against an earlier result file.
+
+    Returns:
+        True if any latency percentile grew (or QPS dropped) by more than REGRESSION_THRESHOLD
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(r['mode'], r['method']): r for r in baseline['results']}
+
+    regressed = False
+    print(f"\nComparison with {baseline_path}:")
+    for row in current['results']:
+        before = old.get((row['mode'], row['method']))
+        if before is None:
+            continue
+        changes = []
+        for key, higher_is_worse in (('p50_ms', True), ('p95_ms', True), ('p99_ms', True), ('qps', False)):
+            if not before[key]:
+                continue
+            change = (row[key] - before[key]) / before[key]
+            worse = change > REGRESSION_THRESHOLD if higher_is_worse else change < -REGRESSION_THRESHOLD
+            regressed |= worse
+            changes.append(f"{key} {change:+.1%}{' !' if worse else ''}")
+        print(f"{row['mode']:>9} {row['method']:>9} | " + ", ".join(changes))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a query log against the search methods')
+    parser.add_argument('--queries', type=str, default=DEFAULT_QUERIES,
+                        help='Query file: one query per line or JSONL with "query"/"method"')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--mode', choices=['inprocess', 'http', 'both'], default='inprocess')
+    parser.add_argument('--url', type=str, default=None,
+                        help='Benchmark an already running API instead of starting one')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help='Replay the query file this many times')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--no-fixture', action='store_true',
+                        help='Use DATABASE_URL/PREPROCESSED_DIR from the environment instead of the SQLite fixture')
+    parser.add_argument('--fixture-dir', type=str, default=os.path.join(BENCH_DIR, '.fixture'),
+                        help='Where the SQLite fixture and its preprocessed artifacts are kept')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Result file (default: benchmarks/results/search-<timestamp>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier result file to compare with')
+    args = parser.parse_args()
+
+    if not args.no_fixture:
+        from benchmarks.fixture import build_fixture
+        build_fixture(args.fixture_dir)
+
+    queries = load_queries(args.queries) * args.repeat
+    print(f"Replaying {len(queries)} queries, concurrency {args.concurrency}")
+
+    results = []
+    if args.mode in ('inprocess', 'both'):
+        results += bench_inprocess(queries, args.methods, args.concurrency, args.limit)
+    if args.mode in ('http', 'both'):
+        results += bench_http(queries, args.methods, args.concurrency, args.limit, args.url)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'settings': {
+            'queries': os.path.basename(args.queries), 'count': len(queries),
+            'concurrency': args.concurrency, 'limit': args.limit,
+            'fixture': not args.no_fixture,
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"search-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResults saved to {output}")
+
+    if args.compare and compare(report, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import argparse
 from app import create_app
 from app.models import Recipe
 from app.search_preprocessing import load_whoosh_index, load_embeddings, verify_whoosh_index
-from sentence_transformers import SentenceTransformer
+from app.encoder import get_encoder
 import torch
 from sentence_transformers import util
 from whoosh.qparser import MultifieldParser
@@ -33,7 +33,7 @@ def search_embeddings(query, model, stored_embeddings, recipe_ids, limit=10):
     
     Args:
         query (str): Search query
-        model: SentenceTransformer model
+        model: QueryEncoder (normalized embeddings, inference mode)
         stored_embeddings: Pre-computed embeddings
         recipe_ids: List of recipe IDs
         limit (int): Maximum number of results
@@ -41,8 +41,7 @@ def search_embeddings(query, model, stored_embeddings, recipe_ids, limit=10):
     Returns:
         list: List of recipe IDs matching the query
     """
-    query_embedding = model.encode(query, convert_to_tensor=True)
-    query_embedding = util.normalize_embeddings(query_embedding.unsqueeze(0))
+    query_embedding = model.encode(query)
     similarities = util.pytorch_cos_sim(query_embedding, stored_embeddings)[0]
     top_indices = torch.topk(similarities, min(limit, len(similarities)))[1]
     return [recipe_ids[idx] for idx in top_indices.tolist()]
@@ -95,7 +94,7 @@ def main():
             else:  # embedding search
                 print(f"Performing embedding search for: {args.query}")
                 recipe_ids, stored_embeddings = load_embeddings()
-                model = SentenceTransformer('all-MiniLM-L6-v2')
+                model = get_encoder()
                 recipe_ids = search_embeddings(args.query, model, stored_embeddings, 
                                             recipe_ids, args.limit)
                 recipes = Recipe.query.filter(Recipe.id.in_(recipe_ids)).all()
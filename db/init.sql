@@ -30,7 +30,15 @@ CREATE TABLE IF NOT EXISTS interactions (
     liked BOOLEAN DEFAULT FALSE,
     bookmarked BOOLEAN DEFAULT FALSE,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+    FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE,
+    UNIQUE INDEX uq_interactions_user_recipe (user_id, recipe_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_interaction_counts (
+    user_id INT PRIMARY KEY,
+    total_interactions INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX ix_user_interaction_counts_total (total_interactions)
 );
 
 LOAD DATA INFILE '/docker-entrypoint-initdb.d/final_recipess.csv'